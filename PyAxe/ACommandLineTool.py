@@ -1,16 +1,50 @@
+import sys
+import time
+import shutil
+import threading
+import subprocess
 from . import (AError, AOS)
 
 
+# 进程内共享的工具查找结果：command -> 可执行文件路径 或 None
+_whichCache = {}
+_whichLock = threading.Lock()
+
+
+def which(command):
+    """查找命令行工具（结果进程内缓存），未找到返回None"""
+    try:
+        return _whichCache[command]
+    except KeyError:
+        pass
+    with _whichLock:
+        if command not in _whichCache:
+            _whichCache[command] = shutil.which(command)
+        return _whichCache[command]
+
+
+def clearWhichCache():
+    """清空工具查找缓存（如运行期间修改了PATH）"""
+    with _whichLock:
+        _whichCache.clear()
+
+
 class CommandLineTool_Error(AError.Error):
     pass
 
 
 class CommandLineTool:
-    def __init__(self, command, execFunc=AOS.system, execOutputFunc=AOS.systemOutput):
+    """
+    命令行工具在首次执行命令时才检查是否存在（不在import时启动子进程），
+    检查通过shutil.which完成，结果进程内缓存
+    """
+    def __init__(self, command, execFunc=AOS.system, execOutputFunc=AOS.systemOutput, execStreamFunc=AOS.systemStream):
         self._command = command
         self._execFunc = execFunc  # 可通过functools.partial包装cmd以外的参数
         self._execOutputFunc = execOutputFunc  # 可通过functools.partial包装cmd以外的参数
+        self._execStreamFunc = execStreamFunc  # 返回输出(bytes)块的生成器，提前关闭时应结束进程
         self._hasCheckExistence = False
+        self._version = None
 
     def checkExistence(self):
         if self._hasCheckExistence:
@@ -19,11 +53,28 @@ class CommandLineTool:
         self._hasCheckExistence = True
 
     def _checkExistence(self):
-        try:
-            AOS.system('%s --version' % self._command, echo=False, nullout=True)
-        except:
+        if which(self._command) is None:
             raise CommandLineTool_Error('%s 命令行工具尚未安装' % self._command)
 
+    @property
+    def path(self):
+        """可执行文件路径"""
+        self.checkExistence()
+        return which(self._command)
+
+    @property
+    def version(self):
+        """`<command> --version`输出的第一行（首次访问时执行）"""
+        if self._version is None:
+            self.checkExistence()
+            try:
+                output = subprocess.check_output([self.path, '--version'], stderr=subprocess.STDOUT)
+            except (OSError, subprocess.CalledProcessError):
+                raise CommandLineTool_Error('%s --version 执行失败' % self._command)
+            lines = output.decode(errors='replace').strip().splitlines()
+            self._version = lines[0] if lines else ''
+        return self._version
+
     @property
     def command(self):
         return self._command
@@ -34,10 +85,49 @@ class CommandLineTool:
     def setExecOutputFunc(self, execOutputFunc):
         self._execOutputFunc = execOutputFunc
 
+    def setExecStreamFunc(self, execStreamFunc):
+        self._execStreamFunc = execStreamFunc
+
     def execCommand(self, args):
         """执行命令"""
+        self.checkExistence()
         self._execFunc('%s %s' % (self._command, args))
 
     def execOutputCommand(self, args):
         """执行命令并输出结果"""
+        self.checkExistence()
         return self._execOutputFunc('%s %s' % (self._command, args))
+
+    def execStreamCommand(self, args):
+        """执行命令，返回边执行边输出的bytes块的生成器"""
+        self.checkExistence()
+        return self._execStreamFunc('%s %s' % (self._command, args))
+
+
+def benchmark(repeat=5):
+    """测量每个PyAxe模块在新进程中的import耗时（毫秒，取最小值）"""
+    import PyAxe
+    baseline = _measureImport('pass', repeat)
+    print('%-20s %10s' % ('module', 'ms'))
+    for moduleName in PyAxe.__all__:
+        elapsed = _measureImport('import PyAxe.%s' % moduleName, repeat)
+        if elapsed is None:
+            print('%-20s %10s' % (moduleName, 'failed'))
+        else:
+            print('%-20s %10.1f' % (moduleName, (elapsed - baseline) * 1000))
+
+
+def _measureImport(statement, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if subprocess.call([sys.executable, '-c', statement],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) != 0:
+            return None
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    benchmark(*[int(arg) for arg in sys.argv[1:]])
@@ -8,3 +8,18 @@ class ScopeGuard:
 
     def __exit__(self, exc_type, exc_value, exc_tb):
         self.handler()
+
+
+def collectClassAttributes(cls, attrType):
+    """
+    按MRO收集cls（含基类）中类型为attrType的类属性，返回[(name, value), ...]
+    与属性查找一致，子类的同名属性覆盖基类的（保留基类中的位置），子类中改为其他类型的值则去掉
+    """
+    ret = {}
+    for klass in reversed(cls.__mro__):
+        for name, value in klass.__dict__.items():
+            if isinstance(value, attrType):
+                ret[name] = value
+            else:
+                ret.pop(name, None)
+    return list(ret.items())
@@ -1,5 +1,8 @@
 import re
+import sys
+import time
 from xml.etree import ElementTree
+from . import ACore
 
 def getChildText(node, childTag, allowEmpty=False):
     childNode = node.find(childTag)
@@ -115,11 +118,26 @@ class SimpleParser:
         except Exception as e:
             raise RuntimeError('文件 %s，解析失败：%s' % (self.filePath, e))
 
+    def iterElements(self, tag, handler=None):
+        """
+        不加载整个文档，流式处理文件中的tag节点（参考模块函数iterElements），适用于大文件
+        子类可在parse中改用此方法
+        """
+        try:
+            yield from iterElements(self.filePath, tag, handler)
+        except Exception as e:
+            raise RuntimeError('文件 %s，解析失败：%s' % (self.filePath, e))
+
     @property
     def filePath(self):
         return self._filePath
 
 
+def _isPlainTag(name):
+    """name是普通标签（而不是ElementPath路径表达式），可以直接与child.tag比较"""
+    return not any(c in name for c in '/[{*.')
+
+
 class SimpleConfigNode:
     def __init__(self, ownerConfig):
         self.ownerConfig = ownerConfig
@@ -134,21 +152,303 @@ class SimpleConfig(SimpleParser):
         self._nodes = nodes
 
     def _parse(self, rootNode):
+        # 普通标签一次遍历根节点的子节点按标签分派（与find一致，取第一个同名节点），
+        # 路径表达式或未找到时用find
+        xmlNodes = {}
+        for node in self._nodes:
+            if _isPlainTag(node[0]):
+                xmlNodes[node[0]] = None
+        for child in rootNode:
+            if child.tag in xmlNodes and xmlNodes[child.tag] is None:
+                xmlNodes[child.tag] = child
+
         for node in self._nodes:
             name = node[0]
             cls = node[1]
-            xmlNode = rootNode.find(name)
+            xmlNode = xmlNodes.get(name)
+            if xmlNode is None:
+                xmlNode = rootNode.find(name)
             if xmlNode is None:
                 raise RuntimeError('<%s> 节点不存在' % name)
-            instance = cls(self)
             try:
-                instance.parseNode(xmlNode)
+                if isinstance(cls, type) and issubclass(cls, Schema):
+                    instance = cls.parse(xmlNode)
+                else:
+                    instance = cls(self)
+                    instance.parseNode(xmlNode)
             except Exception as e:
                 raise RuntimeError('<%s> 节点：%s' % (name, e))
             setattr(self, name, instance)
 
 
+class Field:
+    """
+    Schema中的字段声明
+    :param name: 子节点标签或属性名，None表示与Schema中的属性名相同
+    :param optional: 若为True，表示可选（即该子节点或属性可以不存在）
+    :param defaultValue: 若optional为True，并且不存在，则为defaultValue
+    :param valueTransform: 若不为None，则表示字符串将经过此函数转换
+    """
+    def __init__(self, name=None, optional=False, defaultValue=None, valueTransform=None):
+        self.name = name
+        self.optional = optional
+        self.defaultValue = defaultValue
+        self.valueTransform = valueTransform
+
+
+class ChildField(Field):
+    """子节点的文本，等价于getChildValue"""
+    def _missingError(self, tag):
+        return RuntimeError('子节点 <%s> 不存在' % tag)
+
+    def _transformError(self, tag, value, e):
+        return RuntimeError('子节点 <%s> 的值 %s 不是有效的 %s 值: %s' % (tag, value, self.valueTransform.__name__, e))
+
+
+class ChildBoolField(ChildField):
+    """等价于getChildBool"""
+    def __init__(self, name=None, optional=False, defaultValue=False):
+        ChildField.__init__(self, name, optional, defaultValue, strToBool)
+
+
+class ChildNodeField(ChildField):
+    """
+    子节点按另一个Schema解析
+    :param many: 若为True，所有同名子节点解析为列表（可以为空列表）
+    """
+    def __init__(self, schema, name=None, optional=False, many=False):
+        ChildField.__init__(self, name, optional or many, [] if many else None)
+        self.schema = schema
+        self.many = many
+
+
+class AttributeField(Field):
+    """属性值，等价于getAttributeValue"""
+    def _missingError(self, name):
+        return RuntimeError('属性 %s 不存在' % name)
+
+    def _transformError(self, name, value, e):
+        return RuntimeError('属性 <%s> 的值 %s 不是有效的 %s 值: %s' % (name, value, self.valueTransform.__name__, e))
+
+
+class AttributeBoolField(AttributeField):
+    """等价于getAttributeBool"""
+    def __init__(self, name=None, optional=False, defaultValue=False):
+        AttributeField.__init__(self, name, optional, defaultValue, strToBool)
+
+
+class Schema:
+    """
+    声明式的节点结构，首次使用时编译为专用的解析函数（不再有逐次调用的分派开销）：
+    普通标签的子节点字段较多时一次遍历子节点建立标签到节点的字典，再按字段直接取值（路径表达式始终用find），
+    结果为只含声明字段的__slots__对象
+    可直接用于SimpleConfig的nodes
+    example:
+        class ServerSchema(AElementTree.Schema):
+            host = AElementTree.AttributeField()
+            port = AElementTree.ChildField(valueTransform=int)
+
+        class ConfigSchema(AElementTree.Schema):
+            name = AElementTree.ChildField('Name')
+            debug = AElementTree.ChildBoolField(optional=True)
+            servers = AElementTree.ChildNodeField(ServerSchema, 'Server', many=True)
+
+        config = ConfigSchema.parse(ElementTree.parse('Config.xml').getroot())
+        print(config.servers[0].port)
+    """
+    CHILDREN_DICT_THRESHOLD = 6
+
+    @classmethod
+    def _compile(cls):
+        parser = cls.__dict__.get('_parser')
+        if parser is not None:
+            return parser
+
+        # 编译期间先放一个转发函数，自引用（直接或间接）的Schema编译时拿到的是它，不会无限递归
+        def forward(node):
+            return cls.__dict__['_parser'](node)
+        cls._parser = forward
+        try:
+            parser = cls._compileParser()
+        except:
+            del cls._parser
+            raise
+        cls._parser = parser
+        return parser
+
+    @classmethod
+    def _compileParser(cls):
+        fields = ACore.collectClassAttributes(cls, Field)
+
+        resultClass = type(cls.__name__ + 'Result', (_SchemaResult,), {'__slots__': tuple(fieldName for fieldName, _ in fields)})
+        namespace = {'_newResult': resultClass}
+        lines = ['def parse(node):',
+                 '    r = _newResult()',
+                 '    attrib = node.attrib']
+        singleChildCount = sum(1 for fieldName, field in fields
+                               if isinstance(field, ChildField) and not getattr(field, 'many', False)
+                               and _isPlainTag(field.name or fieldName))
+        # 子节点字段较多时一次遍历建立标签字典（逆序遍历，同名子节点保留第一个，与find一致）；
+        # 字段较少时逐个find（C实现）反而更快
+        useChildrenDict = singleChildCount >= cls.CHILDREN_DICT_THRESHOLD
+        if useChildrenDict:
+            lines.append('    children = {child.tag: child for child in reversed(node)}')
+
+        for i, (fieldName, field) in enumerate(fields):
+            name = field.name or fieldName
+            f = '_f%d' % i
+            namespace[f] = field
+            if isinstance(field, AttributeField):
+                lines.append('    v = attrib.get(%r)' % name)
+            elif getattr(field, 'many', False):
+                namespace[f + 'Parse'] = field.schema._compile()
+                lines.append('    r.%s = [%sParse(child) for child in node.iterfind(%r)]' % (fieldName, f, name))
+                continue
+            elif useChildrenDict and _isPlainTag(name):
+                lines.append('    v = children.get(%r)' % name)
+            else:
+                lines.append('    v = node.find(%r)' % name)
+
+            lines.append('    if v is None:')
+            if field.optional:
+                lines.append('        r.%s = %s.defaultValue' % (fieldName, f))
+            else:
+                lines.append('        raise %s._missingError(%r)' % (f, name))
+            lines.append('    else:')
+            if isinstance(field, ChildNodeField):
+                namespace[f + 'Parse'] = field.schema._compile()
+                lines.append('        v = %sParse(v)' % f)
+            elif isinstance(field, ChildField):
+                lines.append('        v = v.text')
+            if field.valueTransform is not None:
+                lines.append('        try:')
+                lines.append('            v = %s.valueTransform(v)' % f)
+                lines.append('        except Exception as e:')
+                lines.append('            raise %s._transformError(%r, v, e)' % (f, name))
+            lines.append('        r.%s = v' % fieldName)
+        lines.append('    return r')
+
+        exec('\n'.join(lines), namespace)
+        return namespace['parse']
+
+    @classmethod
+    def parse(cls, node):
+        return cls._compile()(node)
+
+
+class _SchemaResult:
+    __slots__ = ()
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__))
+
+
+def benchmark(count=20000, fieldCount=10):
+    """比较Schema与逐个调用getChildValue/getAttributeValue解析大配置的耗时"""
+    items = ''.join('<Item id="%d" enabled="1">%s</Item>' % (i, ''.join('<F%d>%d</F%d>' % (k, i, k) for k in range(fieldCount)))
+                    for i in range(count))
+    rootNode = ElementTree.fromstring('<Config>%s</Config>' % items)
+
+    namespace = {'id': AttributeField(valueTransform=int), 'enabled': AttributeBoolField(),
+                 'comment': ChildField('Comment', optional=True, defaultValue='')}
+    for k in range(fieldCount):
+        namespace['f%d' % k] = ChildField('F%d' % k, valueTransform=int)
+    ItemSchema = type('ItemSchema', (Schema,), namespace)
+
+    def parseByHelpers():
+        ret = []
+        for node in rootNode.iterfind('Item'):
+            item = {
+                'id': getAttributeValue(node, 'id', valueTransform=int),
+                'enabled': getAttributeBool(node, 'enabled'),
+                'comment': getChildValue(node, 'Comment', optional=True, defaultValue=''),
+            }
+            for k in range(fieldCount):
+                item['f%d' % k] = getChildValue(node, 'F%d' % k, valueTransform=int)
+            ret.append(item)
+        return ret
+
+    def parseBySchema():
+        return [ItemSchema.parse(node) for node in rootNode.iterfind('Item')]
+
+    print('%d items x %d fields' % (count, fieldCount))
+    for name, func in (('helpers', parseByHelpers), ('schema', parseBySchema)):
+        begin = time.perf_counter()
+        func()
+        print('%-8s %8.3f s' % (name, time.perf_counter() - begin))
+
+
+_NAMESPACE_PATTERN = re.compile(r'\{.*\}')
+_splitTagCache = {}
+
+
+def splitTag(tag):
+    """
+    {http://www.w3.org/2001/XMLSchema}schema -> ('{http://www.w3.org/2001/XMLSchema}', 'schema')
+    结果按tag缓存（文档中的标签种类有限），避免对每个节点重复执行正则
+    """
+    ret = _splitTagCache.get(tag)
+    if ret is None:
+        m = _NAMESPACE_PATTERN.match(tag)
+        namespace = m.group(0) if m else ''
+        ret = (namespace, tag[len(namespace):])
+        _splitTagCache[tag] = ret
+    return ret
+
+
 def getNamespace(node):
     """{http://www.w3.org/2001/XMLSchema}schema -> {http://www.w3.org/2001/XMLSchema}"""
-    m = re.match('\{.*\}', node.tag)
-    return m.group(0) if m else ''
+    return splitTag(node.tag)[0]
+
+
+class TagMatcher:
+    """
+    判断节点标签是否匹配：'{ns}name'要求命名空间相同，'name'匹配任意命名空间（或无命名空间）下的name
+    每种标签的匹配结果会被缓存
+    """
+    def __init__(self, tags):
+        if isinstance(tags, str):
+            tags = (tags,)
+        self._qualifiedTags = set(tag for tag in tags if tag.startswith('{'))
+        self._localNames = set(tag for tag in tags if not tag.startswith('{'))
+        self._cache = {}
+
+    def __call__(self, tag):
+        ret = self._cache.get(tag)
+        if ret is None:
+            ret = tag in self._qualifiedTags or splitTag(tag)[1] in self._localNames
+            self._cache[tag] = ret
+        return ret
+
+
+def iterElements(source, tag, handler=None):
+    """
+    基于iterparse流式解析source（文件路径或文件对象），依次处理每个标签匹配tag的节点，
+    处理完后立即清除该节点并从父节点中移除，因此内存占用与文档大小无关
+    :param tag: 参考TagMatcher，也可以是多个tag的tuple/list
+    :param handler: 若不为None，返回handler(node)的结果；否则返回节点本身（继续迭代时节点被清除，不要保留引用）
+    注意：匹配的节点不应嵌套（内层节点处理后即被清除）
+    example:
+        for entry in AElementTree.iterElements(xmlPath, 'logentry', parseLogEntry):
+            ...
+    """
+    match = TagMatcher(tag)
+    stack = []
+    for event, node in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(node)
+            continue
+
+        stack.pop()
+        if not match(node.tag):
+            continue
+
+        yield node if handler is None else handler(node)
+
+        node.clear()
+        if stack:
+            stack[-1].remove(node)
+
+
+if __name__ == '__main__':
+    benchmark(*[int(arg) for arg in sys.argv[1:]])
@@ -1,6 +1,17 @@
 import os
 import re
-from . import AError, AOS, AStr
+import sys
+import errno
+import mmap
+import array
+import locale
+import struct
+import shutil
+import tempfile
+from collections import defaultdict
+if os.name != 'nt':
+    import fcntl
+from . import AError, AOS, AStr, AHash, ALog
 
 class File_Error(AError.Error):
     pass
@@ -16,6 +27,32 @@ def write(filePath, content, encoding=None, newline=None):
         fp.write(content)
 
 
+def atomicWrite(filePath, content, encoding=None, newline=None):
+    """
+    先写入同目录下的临时文件，再替换目标文件，保证目标文件要么是旧内容要么是新内容
+    若目标文件已存在，保留其权限位
+    content: str或bytes（bytes以二进制方式写入，忽略encoding和newline）
+    """
+    dirPath = os.path.dirname(os.path.abspath(filePath))
+    fd, tmpPath = tempfile.mkstemp(prefix='.' + os.path.basename(filePath) + '.', suffix='.tmp', dir=dirPath)
+    try:
+        if isinstance(content, bytes):
+            fp = open(fd, 'wb')
+        else:
+            fp = open(fd, 'w', encoding=encoding, newline=newline)
+        with fp:
+            fp.write(content)
+        if os.path.exists(filePath):
+            shutil.copymode(filePath, tmpPath)
+        os.replace(tmpPath, filePath)
+    except BaseException:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+        raise
+
+
 def append(filePath, content, encoding=None, newline=None):
     with open(filePath, 'a', encoding=encoding, newline=newline) as fp:
         fp.write(content)
@@ -42,6 +79,162 @@ def readStripedLines(filePath, *args, **kwargs):
             yield line
 
 
+class LineIndex:
+    """
+    大文本文件（如日志）的行索引：用mmap扫描一次得到每行的起始偏移，之后可随机访问任意行
+    索引缓存在旁路文件(filePath + '.lineidx')中，文件大小和修改时间不变时直接加载；
+    若文件只是变大了（如ALog写的日志），则从上次索引的最后一行开始增量扫描
+    注意：按b'\\n'分行，因此encoding须兼容ASCII（如utf8、gbk），返回的行不包含行尾的换行符
+    example:
+        index = AFile.LineIndex(ALog.getLogFilePath())
+        print(index.getLine(100))
+        for line in index.iterLines(100, 200):
+            print(line)
+        print(index.tail(10))
+    """
+    CACHE_SUFFIX = '.lineidx'
+    _CACHE_MAGIC = b'AXLI0001'
+    _CACHE_HEADER = struct.Struct('<8sQQ')  # magic, fileSize, fileMTimeNS
+    _TAIL_BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, filePath, encoding=None, useCache=True):
+        self.filePath = filePath
+        self.encoding = encoding if encoding is not None else locale.getpreferredencoding(False)
+        self.useCache = useCache
+        self._offsets = None  # array('Q')：每行的起始偏移
+        self._size = 0
+        self._mtimeNS = 0
+
+    @property
+    def cachePath(self):
+        return self.filePath + self.CACHE_SUFFIX
+
+    def _loadCache(self):
+        try:
+            with open(self.cachePath, 'rb') as fp:
+                magic, size, mtimeNS = self._CACHE_HEADER.unpack(fp.read(self._CACHE_HEADER.size))
+                if magic != self._CACHE_MAGIC:
+                    return False
+                offsets = array.array('Q')
+                offsets.frombytes(fp.read())
+        except (OSError, struct.error, ValueError):
+            return False
+
+        self._offsets = offsets
+        self._size = size
+        self._mtimeNS = mtimeNS
+        return True
+
+    def _saveCache(self):
+        content = self._CACHE_HEADER.pack(self._CACHE_MAGIC, self._size, self._mtimeNS) + self._offsets.tobytes()
+        try:
+            atomicWrite(self.cachePath, content)
+        except OSError:
+            pass  # 缓存只是加速手段，目录不可写时忽略
+
+    @staticmethod
+    def _scan(mm, start, end, offsets):
+        find = mm.find
+        append = offsets.append
+        pos = start
+        while pos < end:
+            append(pos)
+            pos = find(b'\n', pos, end)
+            if pos == -1:
+                break
+            pos += 1
+
+    def refresh(self):
+        """确保索引与文件当前内容一致（必要时加载缓存或重新/增量扫描）"""
+        stat = os.stat(self.filePath)
+        if self._offsets is None and self.useCache:
+            self._loadCache()
+
+        if self._offsets is not None and self._size == stat.st_size and self._mtimeNS == stat.st_mtime_ns:
+            return
+
+        if self._offsets is not None and self._size < stat.st_size:
+            # 文件变大：假定只是追加，从最后一行的开头重新扫描
+            offsets = self._offsets
+            start = offsets.pop() if offsets else 0
+        else:
+            offsets = array.array('Q')
+            start = 0
+
+        if stat.st_size > 0:
+            with open(self.filePath, 'rb') as fp:
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    self._scan(mm, start, len(mm), offsets)
+
+        self._offsets = offsets
+        self._size = stat.st_size
+        self._mtimeNS = stat.st_mtime_ns
+        if self.useCache:
+            self._saveCache()
+
+    def _ensureIndex(self):
+        if self._offsets is None:
+            self.refresh()
+        return self._offsets
+
+    def __len__(self):
+        return len(self._ensureIndex())
+
+    def _decodeLine(self, data):
+        if data.endswith(b'\n'):
+            data = data[:-1]
+        if data.endswith(b'\r'):
+            data = data[:-1]
+        return data.decode(self.encoding)
+
+    def getLine(self, n):
+        """返回第n行（从0开始，支持负数）"""
+        offsets = self._ensureIndex()
+        begin = offsets[n]
+        if n < 0:
+            n += len(offsets)
+        end = offsets[n+1] if n+1 < len(offsets) else self._size
+        with open(self.filePath, 'rb') as fp:
+            fp.seek(begin)
+            return self._decodeLine(fp.read(end - begin))
+
+    def iterLines(self, start=0, end=None):
+        """依次返回[start, end)范围内的行"""
+        offsets = self._ensureIndex()
+        start, end, _ = slice(start, end).indices(len(offsets))
+        if start >= end:
+            return
+        with open(self.filePath, 'rb') as fp:
+            fp.seek(offsets[start])
+            for _ in range(end - start):
+                yield self._decodeLine(fp.readline())
+
+    def tail(self, n):
+        """
+        返回最后n行（列表）
+        直接从文件末尾按块向前读取，不需要建立索引
+        """
+        if n <= 0:
+            return []
+
+        with open(self.filePath, 'rb') as fp:
+            pos = fp.seek(0, os.SEEK_END)
+            data = b''
+            # 多读一个换行符，以确定第一行是完整的
+            while pos > 0 and data.count(b'\n', 0, len(data)-1) < n:
+                readSize = min(self._TAIL_BLOCK_SIZE, pos)
+                pos -= readSize
+                fp.seek(pos)
+                data = fp.read(readSize) + data
+
+        lines = data.split(b'\n')
+        if lines and lines[-1] == b'':
+            lines.pop()
+        if pos > 0:
+            lines = lines[1:]  # 第一行可能不完整
+        return [self._decodeLine(line) for line in lines[-n:]]
+
+
 class _replaceContent_StrReplaceError(AError.Error):
     pass
 
@@ -95,6 +288,98 @@ def replaceContentInDir(dir, replaceMap, fileMatchRule=None, useRegex=False, reg
         replaceContent(filePath, replaceMap, useRegex, regexFlags, encoding, newline)
 
 
+_FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+
+def _reflink(src, dst):
+    """写时复制克隆（btrfs/xfs等），不支持时抛出OSError"""
+    if os.name == 'nt' or not sys.platform.startswith('linux'):
+        raise OSError(errno.ENOTSUP, 'reflink not supported on this platform')
+    with open(src, 'rb') as srcFp, open(dst, 'wb') as dstFp:
+        fcntl.ioctl(dstFp.fileno(), _FICLONE, srcFp.fileno())
+
+
+def _replaceWithLink(src, dst, mode):
+    """用src的硬链接（或reflink）原子替换dst，失败则保留dst原样并返回False"""
+    fd, tmpPath = tempfile.mkstemp(prefix='.' + os.path.basename(dst) + '.', suffix='.dedupe', dir=os.path.dirname(os.path.abspath(dst)))
+    os.close(fd)
+    os.remove(tmpPath)
+    try:
+        if mode == 'hardlink':
+            os.link(src, tmpPath)
+        else:
+            _reflink(src, tmpPath)
+            shutil.copystat(dst, tmpPath)
+        os.replace(tmpPath, dst)
+        return True
+    except OSError as e:
+        ALog.warn('dedupe %s -> %s failed, keep the copy: %s' % (dst, src, e))
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+        return False
+
+
+def dedupeTree(dir, fileMatchRule=None, mode='hardlink', hasher=AHash.MD5Hasher, blockSize=64*1024, dryRun=False):
+    """
+    找出目录dir下内容相同的文件，除保留的第一个外都替换为其硬链接（或reflink）
+    先按文件大小分组，再对首尾块计算摘要，只有仍然冲突的文件才计算完整摘要
+    fileMatchRule(fileName, filePath)是一个函数: 用于决定文件是否参与去重
+    mode: 'hardlink' 或 'reflink'（写时复制，修改其中一个文件不影响其他文件）；链接失败时保留原文件
+        硬链接共享同一个inode，因此只在同一设备上且权限、属主、属组都相同的文件之间去重
+    dryRun: 只统计不修改
+    :return (duplicateCount, bytesSaved)
+    """
+    if mode not in ('hardlink', 'reflink'):
+        raise File_Error('dedupeTree: unknown mode %s' % mode)
+
+    sizeGroups = defaultdict(list)  # (size, [st_dev, st_mode, st_uid, st_gid]) -> paths
+    seenInodes = set()
+    for _, filePath in AOS.walkFiles(dir, fileMatchRule=fileMatchRule):
+        if os.path.islink(filePath):
+            continue
+        stat = os.stat(filePath)
+        if stat.st_size == 0:
+            continue
+        inode = (stat.st_dev, stat.st_ino)
+        if inode in seenInodes:  # 已经是硬链接
+            continue
+        seenInodes.add(inode)
+        if mode == 'hardlink':
+            sizeGroups[(stat.st_size, stat.st_dev, stat.st_mode, stat.st_uid, stat.st_gid)].append(filePath)
+        else:
+            sizeGroups[(stat.st_size,)].append(filePath)
+
+    def groupBy(paths, keyFunc):
+        groups = defaultdict(list)
+        for path in paths:
+            groups[keyFunc(path)].append(path)
+        return [group for group in groups.values() if len(group) > 1]
+
+    duplicateCount = 0
+    bytesSaved = 0
+    for key, paths in sizeGroups.items():
+        if len(paths) < 2:
+            continue
+        size = key[0]
+        for group in groupBy(paths, lambda path: hasher.ofFileHeadTail(path, blockSize)):
+            if size > 2 * blockSize:  # 首尾块未覆盖整个文件
+                groups = groupBy(group, hasher.ofFile)
+            else:
+                groups = [group]
+            for sameFiles in groups:
+                keep = sameFiles[0]
+                for dup in sameFiles[1:]:
+                    if dryRun or _replaceWithLink(keep, dup, mode):
+                        ALog.info('dedupe %s -> %s' % (dup, keep))
+                        duplicateCount += 1
+                        bytesSaved += size
+
+    ALog.info('dedupe %s: %d duplicates, %d bytes saved' % (dir, duplicateCount, bytesSaved))
+    return duplicateCount, bytesSaved
+
+
 def isNewer(aPath, bPath):
     """
     a是否比b新
@@ -192,13 +477,17 @@ def convertEncoding(filePath, encodingFrom, encodingTo, newline=None):
     raise RuntimeError(errMsg)
 
 
-def insertStrInFile(filePath, encoding, posCallback, s, newline=None):
+def insertStrInFile(filePath, encoding, posCallback, s, newline=None, skipIfExist=False):
     """
     在文件的某个位置（通过回调获得）插入s
+    skipIfExist: 若文件已包含s（忽略首尾空白）则不做任何事情
     """
     with open(filePath, encoding=encoding, newline=newline) as fp:
         content = fp.read()
-    
+
+    if skipIfExist and s.strip() in content:
+        return
+
     # 找到插入位置
     pos = posCallback(content)
     if pos == -1:
@@ -217,82 +506,135 @@ def searchFirstMatchPos(s, pattern):
     m = pattern.search(s)
     if not m:
         return (-1, -1)
-
-    endPos = m.regs[0][1]
-    length = endPos - m.regs[0][0]
-    return (endPos-length, endPos)
+    return m.span()
 
 
 def insertAtFirstMatchBeginPosOfFile(filePath, encoding, pattern, s, skipIfExist=False):
     """
     在文件匹配模式的第一个匹配处的开始位置插入s
     """
-    if skipIfExist and s.strip() in read(filePath, encoding):
-        return
-            
     def posCallback(content):
         return searchFirstMatchPos(content, pattern)[0]
-        
-    insertStrInFile(filePath, encoding, posCallback, s)
+
+    insertStrInFile(filePath, encoding, posCallback, s, skipIfExist=skipIfExist)
 
 
 def insertAtFirstMatchEndPosOfFile(filePath, encoding, pattern, s, skipIfExist=False):
     """
     在文件匹配模式的第一个匹配处的结束位置插入s
     """
-    if skipIfExist and s.strip() in read(filePath, encoding):
-        return
-            
     def posCallback(content):
         return searchFirstMatchPos(content, pattern)[1]
-    
-    insertStrInFile(filePath, encoding, posCallback, s)
+
+    insertStrInFile(filePath, encoding, posCallback, s, skipIfExist=skipIfExist)
 
 
 def searchLastMatchPos(s, pattern):
     """
     找到所匹配的最后一个子串的位置范围[开始,结束)
     pattern: construct with re.compile
+    只扫描一遍，不对s做切片拷贝
     """
-    pos = 0
-    length = 0  # 匹配的子串长度
-    ss = s[pos:]
-    firstFlag = True
-    while True:
-        m = pattern.search(ss)
-        if m:
-            firstFlag = False
-            endPos = m.regs[0][1]
-            length = endPos - m.regs[0][0]
-            pos += endPos
-            ss = s[pos:]
-        else:
-            if firstFlag:
-                return (-1, -1)
-            return (pos-length, pos)
+    m = None
+    for m in pattern.finditer(s):
+        pass
+    if m is None:
+        return (-1, -1)
+    return m.span()
 
 
 def insertAtLastMatchBeginPosOfFile(filePath, encoding, pattern, s, skipIfExist=False):
     """
     在文件匹配模式的最后一个匹配处的开始位置插入s
     """
-    if skipIfExist and s.strip() in read(filePath, encoding):
-        return
-            
     def posCallback(content):
         return searchLastMatchPos(content, pattern)[0]
-        
-    insertStrInFile(filePath, encoding, posCallback, s)
+
+    insertStrInFile(filePath, encoding, posCallback, s, skipIfExist=skipIfExist)
 
 
 def insertAtLastMatchEndPosOfFile(filePath, encoding, pattern, s, skipIfExist=False):
     """
     在文件匹配模式的最后一个匹配处的结束位置插入s
     """
-    if skipIfExist and s.strip() in read(filePath, encoding):
-        return
-            
     def posCallback(content):
         return searchLastMatchPos(content, pattern)[1]
-    
-    insertStrInFile(filePath, encoding, posCallback, s)
\ No newline at end of file
+
+    insertStrInFile(filePath, encoding, posCallback, s, skipIfExist=skipIfExist)
+
+
+class Editor:
+    """
+    对同一文件做多次插入/替换/追加时使用：进入时只读一次文件，所有修改在内存中依次执行，
+    退出时若内容有变化才原子写入一次（发生异常则放弃所有修改）
+    example:
+        with AFile.Editor(filePath, 'utf8') as editor:
+            editor.insertAtFirstMatchEndPos(re.compile('#include .*\\n'), '#include "a.h"\\n', skipIfExist=True)
+            editor.replace({'OLD': 'NEW'})
+            editor.appendUnique('// end\\n')
+    """
+    def __init__(self, filePath, encoding=None, newline=None):
+        self.filePath = filePath
+        self.encoding = encoding
+        self.newline = newline
+        self.originalContent = None
+        self.content = None
+
+    def __enter__(self):
+        self.originalContent = read(self.filePath, self.encoding, self.newline)
+        self.content = self.originalContent
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if exc_type is None and self.isChanged():
+            atomicWrite(self.filePath, self.content, self.encoding, self.newline)
+
+    def isChanged(self):
+        return self.content != self.originalContent
+
+    def insert(self, posCallback, s, skipIfExist=False):
+        """
+        在某个位置（通过回调posCallback(content)获得）插入s
+        返回是否插入
+        """
+        if skipIfExist and s.strip() in self.content:
+            return False
+
+        pos = posCallback(self.content)
+        if pos == -1:
+            raise File_Error('insert into %s failure: position not found' % self.filePath)
+
+        self.content = AStr.insert(self.content, pos, s)
+        return True
+
+    def insertAtFirstMatchBeginPos(self, pattern, s, skipIfExist=False):
+        return self.insert(lambda content: searchFirstMatchPos(content, pattern)[0], s, skipIfExist)
+
+    def insertAtFirstMatchEndPos(self, pattern, s, skipIfExist=False):
+        return self.insert(lambda content: searchFirstMatchPos(content, pattern)[1], s, skipIfExist)
+
+    def insertAtLastMatchBeginPos(self, pattern, s, skipIfExist=False):
+        return self.insert(lambda content: searchLastMatchPos(content, pattern)[0], s, skipIfExist)
+
+    def insertAtLastMatchEndPos(self, pattern, s, skipIfExist=False):
+        return self.insert(lambda content: searchLastMatchPos(content, pattern)[1], s, skipIfExist)
+
+    def replace(self, replaceMap, useRegex=False, regexFlags=0):
+        """
+        使用replaceMap对内容进行替换
+        useRegex: replaceMap是否使用正则表达式
+        """
+        try:
+            self.content = AStr.replace(self.content, replaceMap, useRegex, regexFlags)
+        except Exception as e:
+            raise File_Error('replace content of %s failure: %s' % (self.filePath, e))
+
+    def append(self, s):
+        self.content += s
+
+    def appendUnique(self, s):
+        """仅当内容中不存在s才追加"""
+        if s in self.content:
+            return False
+        self.content += s
+        return True
@@ -1,11 +1,20 @@
 import os
+import re
+import mmap
+import zlib
+import heapq
+import struct
+import threading
+import shlex
+import subprocess
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from . import (AError, AOS, ACommandLineTool)
 
 
 def _systemOutput(cmd):
     return AOS.systemOutput(cmd, encoding='UTF-8')
 _commandlineTool = ACommandLineTool.CommandLineTool('git', execOutputFunc=_systemOutput)
-_commandlineTool.checkExistence()
 def getCommandLineTool():
     return _commandlineTool
 
@@ -27,6 +36,14 @@ class Git_CommitMessageEmptyError(Git_Error):
     def __init__(self):
         Git_Error.__init__(self, "git commit message can't be empty")
 
+class Git_RevisionError(Git_Error):
+    def __init__(self, revision):
+        Git_Error.__init__(self, "git: unknown revision '%s'" % revision)
+
+
+class Git_ObjectNotFoundError(Git_Error):
+    def __init__(self, sha):
+        Git_Error.__init__(self, "git: object %s not found" % sha)
 
 def execSubCommand(cmdline, **kwargs):
     _commandlineTool.execCommand(cmdline)
@@ -34,12 +51,406 @@ def execSubCommand(cmdline, **kwargs):
 def execOutputSubCommand(cmdline, **kwargs):
     return _commandlineTool.execOutputCommand(cmdline)
 
+def execStreamSubCommand(cmdline, **kwargs):
+    return _commandlineTool.execStreamCommand(cmdline)
+
+def _quoteArg(arg):
+    return subprocess.list2cmdline([arg]) if os.name == 'nt' else shlex.quote(arg)
+
+def _iterNulSeparated(chunks):
+    """按\0切分输出块，逐个yield bytes，结束或提前关闭时关闭chunks（结束git进程）"""
+    try:
+        pending = b''
+        for data in chunks:
+            tokens = (pending + data).split(b'\0')
+            pending = tokens.pop()
+            for token in tokens:
+                yield token
+        if pending:
+            yield pending
+    finally:
+        chunks.close()
+
 
 RESET_TYPE_SOFT = 'soft'
 RESET_TYPE_MIXED = 'mixed'
 RESET_TYPE_HARD = 'hard'
 
 
+_OBJECT_TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+_OBJECT_TYPE_NUMS = {value: key for key, value in _OBJECT_TYPES.items()}
+_OFS_DELTA = 6
+_REF_DELTA = 7
+_REVISION_SUFFIX_PATTERN = re.compile(r'([~^])(\d*)')
+_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+_PSEUDO_REF_PATTERN = re.compile(r'^[A-Z_]+$')  # HEAD、FETCH_HEAD、ORIG_HEAD ...
+
+
+class Commit:
+    __slots__ = ('sha', 'tree', 'parents', 'author', 'authorTime', 'committer', 'commitTime', 'message')
+
+    def __init__(self, sha, data):
+        self.sha = sha
+        self.parents = []
+        self.author = self.committer = ''
+        self.authorTime = self.commitTime = 0
+        self.tree = None
+        header, _, message = data.partition(b'\n\n')
+        self.message = message.decode('UTF-8', 'replace')
+        for line in header.split(b'\n'):
+            key, _, value = line.partition(b' ')
+            if key == b'tree':
+                self.tree = value.decode()
+            elif key == b'parent':
+                self.parents.append(value.decode())
+            elif key == b'author':
+                self.author, self.authorTime = self._parseSignature(value)
+            elif key == b'committer':
+                self.committer, self.commitTime = self._parseSignature(value)
+
+    @staticmethod
+    def _parseSignature(value):
+        # Name <email> 1600000000 +0800
+        vec = value.decode('UTF-8', 'replace').rsplit(' ', 2)
+        try:
+            return vec[0], int(vec[1])
+        except (IndexError, ValueError):
+            return value.decode('UTF-8', 'replace'), 0
+
+    def __repr__(self):
+        return 'Commit(%s)' % self.sha[:10]
+
+
+class TreeEntry:
+    __slots__ = ('mode', 'name', 'sha')
+
+    def __init__(self, mode, name, sha):
+        self.mode = mode
+        self.name = name
+        self.sha = sha
+
+    @property
+    def type(self):
+        if self.mode == '40000':
+            return 'tree'
+        if self.mode == '160000':
+            return 'commit'  # 子模块
+        return 'blob'
+
+    def __repr__(self):
+        return 'TreeEntry(%s %s %s)' % (self.mode, self.type, self.name)
+
+
+class _PackFile:
+    """
+    一个pack-*.pack及其v2版本的.idx，两者都通过mmap访问
+    """
+    def __init__(self, idxPath):
+        self.idxPath = idxPath
+        self.packPath = idxPath[:-len('.idx')] + '.pack'
+        with open(idxPath, 'rb') as fp:
+            self._idx = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.packPath, 'rb') as fp:
+            self._pack = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._idx[:8] != b'\377tOc\0\0\0\2':
+            raise Git_ParseMetaDataError('unsupported pack index version: %s' % idxPath)
+        self._fanout = struct.unpack_from('>256I', self._idx, 8)
+        self.count = self._fanout[255]
+        self._shaTable = 8 + 256 * 4
+        self._offsetTable = self._shaTable + self.count * 24  # sha(20) + crc32(4)
+        self._largeOffsetTable = self._offsetTable + self.count * 4
+
+    def close(self):
+        self._idx.close()
+        self._pack.close()
+
+    def findOffset(self, binSha):
+        """二分查找.idx中的sha，返回pack内的偏移，不存在返回None"""
+        first = binSha[0]
+        lo = self._fanout[first - 1] if first > 0 else 0
+        hi = self._fanout[first]
+        idx = self._idx
+        shaTable = self._shaTable
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = shaTable + mid * 20
+            midSha = idx[pos:pos + 20]
+            if midSha < binSha:
+                lo = mid + 1
+            elif midSha > binSha:
+                hi = mid
+            else:
+                offset = struct.unpack_from('>I', idx, self._offsetTable + mid * 4)[0]
+                if offset & 0x80000000:
+                    offset = struct.unpack_from('>Q', idx, self._largeOffsetTable + (offset & 0x7fffffff) * 8)[0]
+                return offset
+        return None
+
+    def readRaw(self, offset):
+        """
+        读取偏移处的对象，返回(typeNum, data, base)
+        delta对象的data为delta指令，base为基对象的偏移(OFS_DELTA)或sha(REF_DELTA)
+        """
+        pack = self._pack
+        byte = pack[offset]
+        offset += 1
+        typeNum = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = pack[offset]
+            offset += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+
+        base = None
+        if typeNum == _OFS_DELTA:
+            byte = pack[offset]
+            offset += 1
+            distance = byte & 0x7f
+            while byte & 0x80:
+                byte = pack[offset]
+                offset += 1
+                distance = ((distance + 1) << 7) | (byte & 0x7f)
+            base = -distance  # 相对于对象头的偏移，由调用者换算
+        elif typeNum == _REF_DELTA:
+            base = pack[offset:offset + 20]
+            offset += 20
+
+        decompressor = zlib.decompressobj()
+        chunks = []
+        chunkSize = max(size, 4096)
+        while not decompressor.eof:
+            chunk = pack[offset:offset + chunkSize]
+            if not chunk:
+                raise Git_ParseMetaDataError('truncated pack: %s' % self.packPath)
+            offset += len(chunk)
+            chunks.append(decompressor.decompress(chunk))
+        return typeNum, b''.join(chunks), base
+
+
+def _applyDelta(source, delta):
+    def readVarint(pos):
+        value = shift = 0
+        while True:
+            byte = delta[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, pos
+
+    _, pos = readVarint(0)
+    _, pos = readVarint(pos)
+    out = []
+    deltaLen = len(delta)
+    while pos < deltaLen:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:  # copy from source
+            copyOffset = copySize = 0
+            for i in range(4):
+                if op & (1 << i):
+                    copyOffset |= delta[pos] << (i * 8)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    copySize |= delta[pos] << (i * 8)
+                    pos += 1
+            if copySize == 0:
+                copySize = 0x10000
+            out.append(source[copyOffset:copyOffset + copySize])
+        elif op:  # insert
+            out.append(delta[pos:pos + op])
+            pos += op
+        else:
+            raise Git_ParseMetaDataError('invalid delta opcode 0')
+    return b''.join(out)
+
+
+class ObjectDatabase:
+    """
+    只读访问.git/objects：loose对象，以及通过.idx(v2)定位的pack对象，不启动git进程
+    支持objects/info/alternates
+    """
+    BASE_CACHE_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, objectsDir):
+        self.objectsDirs = [objectsDir]
+        alternatesPath = os.path.join(objectsDir, 'info', 'alternates')
+        if os.path.isfile(alternatesPath):
+            with open(alternatesPath) as fp:
+                for line in fp:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        self.objectsDirs.append(os.path.normpath(os.path.join(objectsDir, line)))
+        self._lock = threading.Lock()
+        self._packs = None
+        self._packsSignature = None
+        self._baseCache = collections.OrderedDict()  # (pack, offset) -> (typeNum, data)，缓存delta链上的基对象
+        self._baseCacheBytes = 0
+
+    def _getPacksSignature(self):
+        """各pack目录的修改时间，增删pack文件（gc/fetch）后会变化"""
+        signature = []
+        for objectsDir in self.objectsDirs:
+            try:
+                signature.append(os.stat(os.path.join(objectsDir, 'pack')).st_mtime_ns)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _loadPacks(self, oldPacks):
+        """未变化的pack沿用已打开的，已删除的pack关闭"""
+        oldPacks = {pack.idxPath: pack for pack in oldPacks}
+        packs = []
+        for objectsDir in self.objectsDirs:
+            packDir = os.path.join(objectsDir, 'pack')
+            if not os.path.isdir(packDir):
+                continue
+            for fileName in sorted(os.listdir(packDir)):
+                idxPath = os.path.join(packDir, fileName)
+                if fileName.endswith('.idx') and os.path.isfile(idxPath[:-4] + '.pack'):
+                    pack = oldPacks.pop(idxPath, None)
+                    packs.append(pack if pack is not None else _PackFile(idxPath))
+        for pack in oldPacks.values():
+            pack.close()
+        return packs
+
+    def _getPacks(self, rescan=False):
+        with self._lock:
+            if self._packs is None:
+                self._packsSignature = self._getPacksSignature()
+                self._packs = self._loadPacks([])
+            elif rescan:
+                signature = self._getPacksSignature()
+                if signature != self._packsSignature:
+                    self._packsSignature = signature
+                    self._packs = self._loadPacks(self._packs)
+                    self._baseCache.clear()
+                    self._baseCacheBytes = 0
+            return self._packs
+
+    def close(self):
+        with self._lock:
+            for pack in self._packs or []:
+                pack.close()
+            self._packs = None
+            self._baseCache.clear()
+            self._baseCacheBytes = 0
+
+    def read(self, sha):
+        """返回(type, data)，type为commit/tree/blob/tag"""
+        for objectsDir in self.objectsDirs:
+            path = os.path.join(objectsDir, sha[:2], sha[2:])
+            try:
+                with open(path, 'rb') as fp:
+                    raw = zlib.decompress(fp.read())
+            except FileNotFoundError:
+                continue
+            header, _, data = raw.partition(b'\0')
+            return header.split(b' ', 1)[0].decode(), data
+
+        binSha = bytes.fromhex(sha)
+        for rescan in (False, True):  # 找不到时若pack目录有变化则重新扫描（可能刚执行过gc/fetch）
+            try:
+                for pack in self._getPacks(rescan):
+                    offset = pack.findOffset(binSha)
+                    if offset is not None:
+                        typeNum, data = self._readPacked(pack, offset)
+                        return _OBJECT_TYPES[typeNum], data
+            except ValueError:  # pack已被删除并被其他线程的重新扫描关闭
+                continue
+        raise Git_ObjectNotFoundError(sha)
+
+    def contains(self, sha):
+        try:
+            self.read(sha)
+        except Git_ObjectNotFoundError:
+            return False
+        return True
+
+    def _readPacked(self, pack, offset):
+        chain = []
+        external = False
+        while True:
+            key = (pack.packPath, offset)
+            with self._lock:
+                cached = self._baseCache.get(key)
+            if cached is not None:
+                typeNum, data = cached
+                break
+            typeNum, data, base = pack.readRaw(offset)
+            if typeNum == _OFS_DELTA:
+                chain.append((key, data))
+                offset += base
+            elif typeNum == _REF_DELTA:
+                chain.append((key, data))
+                baseSha = base.hex()
+                baseOffset = pack.findOffset(base)
+                if baseOffset is None:
+                    baseType, data = self.read(baseSha)  # thin pack，基对象在其他pack或loose对象中
+                    typeNum = _OBJECT_TYPE_NUMS[baseType]
+                    external = True
+                    break
+                offset = baseOffset
+            else:
+                break
+
+        if not external:  # 外部基对象不在此pack的offset处（offset仍指向delta），不能以此为key缓存
+            with self._lock:
+                self._cacheBase((pack.packPath, offset), typeNum, data)
+        for key, delta in reversed(chain):
+            data = _applyDelta(data, delta)
+            with self._lock:
+                self._cacheBase(key, typeNum, data)
+        return typeNum, data
+
+    def _cacheBase(self, key, typeNum, data):
+        if len(data) > self.BASE_CACHE_BYTES // 4:
+            return
+        cache = self._baseCache
+        old = cache.pop(key, None)
+        if old is not None:
+            self._baseCacheBytes -= len(old[1])
+        cache[key] = (typeNum, data)
+        self._baseCacheBytes += len(data)
+        while self._baseCacheBytes > self.BASE_CACHE_BYTES:
+            _, (_, evicted) = cache.popitem(last=False)
+            self._baseCacheBytes -= len(evicted)
+
+
+UNTRACKED_FILES_NO = 'no'
+UNTRACKED_FILES_NORMAL = 'normal'  # 未跟踪的目录只列出目录本身
+UNTRACKED_FILES_ALL = 'all'  # 列出未跟踪目录中的每个文件
+
+
+class StatusEntry:
+    """
+    git status --porcelain=v2的一条记录
+    kind: changed/renamed(包括复制)/unmerged/untracked/ignored
+    index, worktree: 暂存区和工作区的状态字符（.表示未修改，M/T/A/D/R/C/U），untracked/ignored为?/!
+    origPath: renamed时为原路径，否则为None
+    """
+    __slots__ = ('kind', 'index', 'worktree', 'path', 'origPath')
+
+    def __init__(self, kind, index, worktree, path, origPath=None):
+        self.kind = kind
+        self.index = index
+        self.worktree = worktree
+        self.path = path
+        self.origPath = origPath
+
+    def __repr__(self):
+        if self.origPath is not None:
+            return 'StatusEntry(%s%s %s -> %s)' % (self.index, self.worktree, self.origPath, self.path)
+        return 'StatusEntry(%s%s %s)' % (self.index, self.worktree, self.path)
+
+
+def _decodePath(b):
+    return b.decode('UTF-8', 'surrogateescape')
+
+
 class Repository:
     def __init__(self, path):
         """
@@ -47,20 +458,29 @@ class Repository:
         """
         self.workDir = path
         self.metaDir = os.path.join(self.workDir, '.git')
+        self._gitDir = None
+        self._commonDir = None
+        self._objectDatabase = None
+        self._packedRefs = None
+
+    def _makeWorkDirCmdline(self, cmdline):
+        # 用git -C指定目录而不是os.chdir，多个线程可以同时操作不同的仓库
+        return '-C %s %s' % (AOS.fixPathArg(self.workDir), cmdline)
 
     def execSubCommand(self, cmdline, **kwargs):
-        with AOS.ChangeDir(self.workDir):
-            execSubCommand(cmdline, **kwargs)
+        execSubCommand(self._makeWorkDirCmdline(cmdline), **kwargs)
 
     def execOutputSubCommand(self, cmdline, **kwargs):
-        with AOS.ChangeDir(self.workDir):
-            return execOutputSubCommand(cmdline, **kwargs)
+        return execOutputSubCommand(self._makeWorkDirCmdline(cmdline), **kwargs)
+
+    def execStreamSubCommand(self, cmdline, **kwargs):
+        return execStreamSubCommand(self._makeWorkDirCmdline(cmdline), **kwargs)
 
     def getCurrentBranch(self):
         """
         return a tuple(branch, revision)
         """
-        filePath = os.path.join(self.metaDir, 'HEAD')
+        filePath = os.path.join(self.gitDir, 'HEAD')
         with open(filePath) as fp:
             try:
                 line = fp.readline().rstrip('\n')
@@ -74,15 +494,232 @@ class Repository:
                 raise Git_ParseMetaDataError("Can't parse branch name from HEAD file %s: %s" % (filePath, str(e)))
 
         if branch != '':
-            filePath = os.path.normpath(os.path.join(self.metaDir, 'refs', 'heads', branch))
-            with open(filePath) as fp:
-                try:
-                    revision = fp.readline().rstrip('\n')
-                except Exception as e:
-                    raise Git_ParseMetaDataError("Can't parse revision from %s: %s" % (filePath, str(e)))
+            try:
+                revision = self.readRef('refs/heads/' + branch)  # 也可能在packed-refs中
+            except Exception as e:
+                raise Git_ParseMetaDataError("Can't parse revision of branch %s: %s" % (branch, str(e)))
 
         return branch, revision
 
+    @property
+    def gitDir(self):
+        """.git目录，子模块/worktree中.git为文件（gitdir: <path>）时返回其指向的目录"""
+        if self._gitDir is None:
+            gitDir = self.metaDir
+            if os.path.isfile(gitDir):
+                with open(gitDir) as fp:
+                    line = fp.readline().strip()
+                if not line.startswith('gitdir:'):
+                    raise Git_ParseMetaDataError("Can't parse gitdir from %s" % gitDir)
+                gitDir = os.path.normpath(os.path.join(self.workDir, line[len('gitdir:'):].strip()))
+            self._gitDir = gitDir
+        return self._gitDir
+
+    @property
+    def commonDir(self):
+        """refs和objects所在目录，worktree中由commondir文件指定"""
+        if self._commonDir is None:
+            commonDir = self.gitDir
+            filePath = os.path.join(commonDir, 'commondir')
+            if os.path.isfile(filePath):
+                with open(filePath) as fp:
+                    commonDir = os.path.normpath(os.path.join(commonDir, fp.readline().strip()))
+            self._commonDir = commonDir
+        return self._commonDir
+
+    @property
+    def objectDatabase(self):
+        if self._objectDatabase is None:
+            self._objectDatabase = ObjectDatabase(os.path.join(self.commonDir, 'objects'))
+        return self._objectDatabase
+
+    def _readPackedRefs(self):
+        filePath = os.path.join(self.commonDir, 'packed-refs')
+        try:
+            mtime = os.stat(filePath).st_mtime_ns
+        except OSError:
+            return {}
+        if self._packedRefs is None or self._packedRefs[0] != mtime:
+            refs = {}
+            with open(filePath) as fp:
+                for line in fp:
+                    if line.startswith('#') or line.startswith('^'):  # 注释 或 附注标签peel后的提交
+                        continue
+                    vec = line.rstrip('\n').split(' ', 1)
+                    if len(vec) == 2:
+                        refs[vec[1]] = vec[0]
+            self._packedRefs = (mtime, refs)
+        return self._packedRefs[1]
+
+    def readRef(self, ref):
+        """
+        读取引用(HEAD、refs/heads/master ...)，返回sha，不存在返回None
+        与git一致，只有全大写的名字(HEAD、FETCH_HEAD ...)和refs/下的名字是引用，其他（如config）返回None
+        符号引用(ref: ...)会继续解析，loose引用文件不存在时查找packed-refs
+        """
+        for _ in range(10):  # 防止符号引用循环
+            if _PSEUDO_REF_PATTERN.match(ref):
+                baseDir = self.gitDir
+            elif ref.startswith('refs/'):
+                baseDir = self.commonDir
+            else:
+                return None
+            try:
+                with open(os.path.join(baseDir, *ref.split('/'))) as fp:
+                    line = fp.readline().strip()
+            except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+                sha = self._readPackedRefs().get(ref)
+                break
+            if not line.startswith('ref:'):
+                sha = line.split()[0] if line else ''  # FETCH_HEAD: <sha>\t...
+                break
+            ref = line[len('ref:'):].strip()
+        else:
+            raise Git_ParseMetaDataError('symbolic ref loop: %s' % ref)
+        if sha is not None and not _SHA_PATTERN.match(sha):
+            raise Git_RevisionError(ref)
+        return sha
+
+    def revParse(self, revision='HEAD'):
+        """
+        解析版本为完整sha：完整sha、HEAD、分支/标签/远程分支名、refs/...，可带~n和^n后缀
+        不支持缩写sha等其他git rev-parse语法
+        """
+        match = _REVISION_SUFFIX_PATTERN.search(revision)
+        name = revision[:match.start()] if match else revision
+        sha = None
+        if _SHA_PATTERN.match(name):
+            sha = name
+        else:
+            for ref in (name, 'refs/' + name, 'refs/tags/' + name, 'refs/heads/' + name,
+                        'refs/remotes/' + name, 'refs/remotes/' + name + '/HEAD'):
+                sha = self.readRef(ref)
+                if sha is not None:
+                    break
+        if sha is None:
+            raise Git_RevisionError(revision)
+
+        if match:
+            suffix = revision[match.start():]
+            if _REVISION_SUFFIX_PATTERN.sub('', suffix):
+                raise Git_RevisionError(revision)
+            for op, number in _REVISION_SUFFIX_PATTERN.findall(suffix):
+                number = int(number) if number else 1
+                if op == '~':
+                    for _ in range(number):
+                        parents = self._peelCommit(sha).parents
+                        if not parents:
+                            raise Git_RevisionError(revision)
+                        sha = parents[0]
+                elif number > 0:
+                    parents = self._peelCommit(sha).parents
+                    if len(parents) < number:
+                        raise Git_RevisionError(revision)
+                    sha = parents[number - 1]
+        return sha
+
+    def readObject(self, sha):
+        """返回(type, data)"""
+        if not _SHA_PATTERN.match(sha):
+            raise Git_ObjectNotFoundError(sha)
+        return self.objectDatabase.read(sha)
+
+    def _peelCommit(self, sha):
+        for _ in range(10):
+            objectType, data = self.readObject(sha)
+            if objectType == 'commit':
+                return Commit(sha, data)
+            if objectType != 'tag':
+                raise Git_RevisionError(sha)
+            sha = data[len(b'object '):data.index(b'\n')].decode()  # 附注标签
+        raise Git_RevisionError(sha)
+
+    def getCommit(self, revision='HEAD'):
+        return self._peelCommit(self.revParse(revision))
+
+    def iterCommits(self, revision='HEAD', limit=None, firstParent=False):
+        """
+        从revision开始按提交时间从新到旧遍历历史（与git log默认顺序一致），yield Commit
+        """
+        commit = self.getCommit(revision)
+        heap = [(-commit.commitTime, 0, commit)]
+        seen = {commit.sha}
+        counter = 1
+        count = 0
+        while heap and (limit is None or count < limit):
+            _, _, commit = heapq.heappop(heap)
+            yield commit
+            count += 1
+            parents = commit.parents[:1] if firstParent else commit.parents
+            for parentSha in parents:
+                if parentSha in seen:
+                    continue
+                seen.add(parentSha)
+                parent = self._peelCommit(parentSha)
+                heapq.heappush(heap, (-parent.commitTime, counter, parent))
+                counter += 1
+
+    def _readTree(self, sha):
+        objectType, data = self.readObject(sha)
+        if objectType != 'tree':
+            raise Git_Error('git: %s is a %s, not a tree' % (sha, objectType))
+        entries = []
+        pos = 0
+        end = len(data)
+        while pos < end:
+            space = data.index(b' ', pos)
+            nul = data.index(b'\0', space)
+            entries.append(TreeEntry(data[pos:space].decode(), data[space + 1:nul].decode('UTF-8', 'surrogateescape'),
+                                     data[nul + 1:nul + 21].hex()))
+            pos = nul + 21
+        return entries
+
+    def _findTreeEntry(self, revision, path):
+        """返回path对应的TreeEntry，path为空时返回根目录"""
+        tree = self.getCommit(revision).tree
+        entry = TreeEntry('40000', '', tree)
+        for name in path.replace('\\', '/').strip('/').split('/') if path.strip('/\\') else []:
+            if entry.type != 'tree':
+                raise Git_Error("git: path '%s' does not exist in '%s'" % (path, revision))
+            for child in self._readTree(entry.sha):
+                if child.name == name:
+                    entry = child
+                    break
+            else:
+                raise Git_Error("git: path '%s' does not exist in '%s'" % (path, revision))
+        return entry
+
+    def listTree(self, revision='HEAD', path='', recursive=False):
+        """
+        列出revision中path目录的内容，返回TreeEntry列表
+        recursive为True时递归列出所有文件（不含目录），name为相对path的路径
+        """
+        entry = self._findTreeEntry(revision, path)
+        if entry.type != 'tree':
+            raise Git_Error("git: path '%s' is not a directory in '%s'" % (path, revision))
+        if not recursive:
+            return self._readTree(entry.sha)
+
+        ret = []
+        stack = [('', entry.sha)]
+        while stack:
+            prefix, sha = stack.pop()
+            for child in self._readTree(sha):
+                name = prefix + child.name
+                if child.type == 'tree':
+                    stack.append((name + '/', child.sha))
+                else:
+                    ret.append(TreeEntry(child.mode, name, child.sha))
+        ret.sort(key=lambda child: child.name)
+        return ret
+
+    def readFile(self, revision, path):
+        """返回revision中文件path的内容(bytes)"""
+        entry = self._findTreeEntry(revision, path)
+        if entry.type != 'blob':
+            raise Git_Error("git: path '%s' is not a file in '%s'" % (path, revision))
+        return self.readObject(entry.sha)[1]
+
     def export(self, path):
         """
         The packing format is decided auto from the ext of <path>
@@ -162,36 +799,80 @@ class Repository:
         cmd += ' %s' % path
         self.execSubCommand(cmd)
 
-    def status(self, modified=True, deleted=True, untracked=False, ignored=False):
+    def iterStatus(self, untrackedFiles=UNTRACKED_FILES_NO, ignored=False, pathspecs=None,
+                   fsmonitor=False, untrackedCache=False):
+        """
+        流式解析git status --porcelain=v2 -z，逐个yield StatusEntry
+        :param untrackedFiles: UNTRACKED_FILES_XXX
+        :param ignored: True则包括忽略的文件
+        :param pathspecs: 只查询这些路径（git pathspec）
+        :param fsmonitor: 启用core.fsmonitor（git内置的文件系统监视，大仓库中首次之后的status更快）
+        :param untrackedCache: 启用core.untrackedCache，加快未跟踪文件的查找
+        """
+        args = []
+        if fsmonitor:
+            args += ['-c', 'core.fsmonitor=true']
+        if untrackedCache:
+            args += ['-c', 'core.untrackedCache=true']
+        args += ['status', '--porcelain=v2', '-z', '--untracked-files=%s' % untrackedFiles]
+        if ignored:
+            args.append('--ignored')
+        args.append('--')
+        if pathspecs:
+            args += list(pathspecs)
+
+        tokens = _iterNulSeparated(self.execStreamSubCommand(' '.join(_quoteArg(arg) for arg in args)))
+        for token in tokens:
+            kind = token[:2]
+            if kind == b'1 ':
+                # 1 XY sub mH mI mW hH hI path
+                fields = token.split(b' ', 8)
+                yield StatusEntry('changed', chr(fields[1][0]), chr(fields[1][1]), _decodePath(fields[8]))
+            elif kind == b'2 ':
+                # 2 XY sub mH mI mW hH hI Xscore path\0origPath
+                fields = token.split(b' ', 9)
+                yield StatusEntry('renamed', chr(fields[1][0]), chr(fields[1][1]), _decodePath(fields[9]),
+                                  _decodePath(next(tokens)))
+            elif kind == b'u ':
+                # u XY sub m1 m2 m3 mW h1 h2 h3 path
+                fields = token.split(b' ', 10)
+                yield StatusEntry('unmerged', chr(fields[1][0]), chr(fields[1][1]), _decodePath(fields[10]))
+            elif kind == b'? ':
+                yield StatusEntry('untracked', '?', '?', _decodePath(token[2:]))
+            elif kind == b'! ':
+                yield StatusEntry('ignored', '!', '!', _decodePath(token[2:]))
+
+    def status(self, modified=True, deleted=True, untracked=False, ignored=False, added=True, renamed=True,
+               pathspecs=None):
         """
-        返回修改的文件列表
-        :param modified: True则显示修改的文件
+        返回修改的文件列表（包括已暂存的修改），详细信息见iterStatus
+        :param modified: True则显示修改的文件（包括冲突的文件）
         :param deleted: True则显示删除的文件
         :param untracked: True则显示未跟踪的文件
         :param ignored: True则显示忽略的文件
+        :param added: True则显示新增到暂存区的文件
+        :param renamed: True则显示重命名/复制后的文件（新路径）
+        :param pathspecs: 只查询这些路径
         """
-        cmd = 'status -s'
-        if not untracked:
-            cmd += ' -uno'
-        if ignored:
-            cmd += ' --ignored'
-
         ret = []
-        for line in self.execOutputSubCommand(cmd).split('\n'):
-            if line == '':
-                continue
-            if line.startswith(' M '):
-                if modified:
-                    ret.append(line[3:])
-            elif line.startswith(' D '):
-                if deleted:
-                    ret.append(line[3:])
-            elif line.startswith('?? '):
-                if untracked:
-                    ret.append(line[3:])
-            elif line.startswith('!! '):
-                if ignored:
-                    ret.append(line[3:])
+        untrackedFiles = UNTRACKED_FILES_NORMAL if untracked else UNTRACKED_FILES_NO
+        for entry in self.iterStatus(untrackedFiles, ignored, pathspecs):
+            kind = entry.kind
+            if kind == 'untracked':
+                include = untracked
+            elif kind == 'ignored':
+                include = ignored
+            elif kind == 'unmerged':
+                include = modified
+            elif kind == 'renamed':
+                include = renamed
+            else:
+                states = entry.index + entry.worktree
+                include = ((modified and ('M' in states or 'T' in states))
+                           or (deleted and 'D' in states)
+                           or (added and entry.index == 'A'))
+            if include:
+                ret.append(entry.path)
         return ret
 
     def commit(self, msg, all=False):
@@ -207,3 +888,31 @@ class Repository:
             cmd += ' -a'
         cmd += ' -m "%s"' % msg
         self.execSubCommand(cmd)
+
+
+def forEachRepo(repos, op, jobs=4):
+    """
+    在多个仓库上并发执行操作（Repository的命令都通过git -C执行，线程安全）
+    :param repos: Repository或仓库路径的列表
+    :param op: 可调用对象op(repo)，或Repository的方法名（无参数调用，如'pull'、'status'）
+        例：forEachRepo(repos, lambda repo: repo.cloneOrPull(urls[repo.workDir]), jobs=8)
+    :return: (results, errors)，分别为{workDir: 返回值}和{workDir: 异常}，顺序与repos一致
+    """
+    repos = [repo if isinstance(repo, Repository) else Repository(repo) for repo in repos]
+    func = (lambda repo: getattr(repo, op)()) if isinstance(op, str) else op
+
+    def run(repo):
+        try:
+            return True, func(repo)
+        except Exception as e:
+            return False, e
+
+    results = collections.OrderedDict()
+    errors = collections.OrderedDict()
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for repo, (ok, value) in zip(repos, executor.map(run, repos)):
+            if ok:
+                results[repo.workDir] = value
+            else:
+                errors[repo.workDir] = value
+    return results, errors
@@ -33,6 +33,26 @@ class Hasher:
         _updateByFile(m, filePath)
         return m.hexdigest()
 
+    def ofFileHeadTail(self, filePath, blockSize=64*1024):
+        """
+        仅对文件的大小、首块和尾块计算摘要，用于快速排除内容不同的文件
+        文件不超过2*blockSize时等价于对整个文件计算摘要（外加文件大小）
+        """
+        if not os.path.isfile(filePath):
+            raise Hash_Error("%s is not file" % filePath)
+        m = self.cls()
+        with open(filePath, 'rb') as fp:
+            size = fp.seek(0, os.SEEK_END)
+            m.update(str(size).encode('UTF-8'))
+            fp.seek(0)
+            if size <= 2 * blockSize:
+                m.update(fp.read())
+            else:
+                m.update(fp.read(blockSize))
+                fp.seek(-blockSize, os.SEEK_END)
+                m.update(fp.read(blockSize))
+        return m.hexdigest()
+
     def ofDir(self, dirPath):
         if not os.path.isdir(dirPath):
             raise Hash_Error("%s is not dir" % dirPath)
@@ -1,5 +1,7 @@
+import os
 import sys
 import inspect
+import threading
 import codecs
 import configparser
 from . import AError
@@ -37,6 +39,9 @@ class INI_Error(AError.Error):
     pass
 
 
+_cache_lock = threading.Lock()
+
+
 class Field:
     def __init__(self, default=None):
         self.default = default
@@ -143,27 +148,38 @@ class Section:
 
 class INI:
     @classmethod
-    def load(cls, file_path, encoding='UTF-8'):
+    def _get_schema(cls):
+        """
+        Collect the (section_name, section_cls, [(field_name, field), ...]) list once per INI subclass
+        """
+        schema = cls.__dict__.get('_schema')
+        if schema is None:
+            schema = []
+            for section_name, section_cls in cls.__dict__.items():
+                if not (inspect.isclass(section_cls) and issubclass(section_cls, Section)):
+                    continue
+                fields = [(field_name, field) for field_name, field in section_cls.__dict__.items()
+                          if isinstance(field, Field)]
+                schema.append((section_name, section_cls, fields))
+            cls._schema = schema
+        return schema
+
+    @classmethod
+    def _parse(cls, file_path, encoding):
         conf = configparser.ConfigParser()
 
         try:
-            fp = codecs.open(file_path, 'r', encoding)
-            configparser.ConfigParser.read_file(conf, fp)
+            with codecs.open(file_path, 'r', encoding) as fp:
+                configparser.ConfigParser.read_file(conf, fp)
         except Exception as e:
             raise INI_Error(str(e))
 
         ret = cls()
-        for section_name, section_cls in cls.__dict__.items():
-            if not (inspect.isclass(section_cls) and issubclass(section_cls, Section)):
-                continue
-
+        for section_name, section_cls, fields in cls._get_schema():
             section = section_cls()
             setattr(ret, section_name, section)
 
-            for field_name, field in section_cls.__dict__.items():
-                if not isinstance(field, Field):
-                    continue
-
+            for field_name, field in fields:
                 try:
                     origin_value = conf.get(section_name, field_name)
                 except (configparser.NoSectionError, configparser.NoOptionError) as e:
@@ -185,6 +201,118 @@ class INI:
 
         return ret
 
+    @classmethod
+    def load(cls, file_path, encoding='UTF-8', use_cache=True):
+        """
+        use_cache: return the already built config while the file's mtime and size are unchanged
+            (the returned config is shared, do not modify it)
+        """
+        if not use_cache:
+            return cls._parse(file_path, encoding)
+
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            raise INI_Error(str(e))
+        key = (os.path.abspath(file_path), encoding)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with _cache_lock:
+            cache = cls.__dict__.get('_cache')
+            if cache is None:
+                cache = cls._cache = {}
+            cached = cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        ret = cls._parse(file_path, encoding)
+        with _cache_lock:
+            cache[key] = (version, ret)
+        return ret
+
+    @classmethod
+    def watch(cls, file_path, encoding='UTF-8', interval=1.0, on_reload=None, on_error=None):
+        """
+        Load the config and start a background thread which reloads it when the file changes,
+        see INIWatcher
+        """
+        watcher = INIWatcher(cls, file_path, encoding, interval, on_reload, on_error)
+        watcher.start()
+        return watcher
+
+
+class INIWatcher:
+    """
+    Keep a config up to date: a daemon thread polls the file every `interval` seconds, reloads it when
+    its mtime or size changes and swaps `config` in one assignment, so readers always see a complete config.
+    If the new file is invalid the old config is kept and on_error(e) is called.
+
+        watcher = MyConfig.watch('example.ini')
+        ...
+        print(watcher.config.Section1.int_field)
+        ...
+        watcher.stop()
+    """
+    def __init__(self, ini_cls, file_path, encoding='UTF-8', interval=1.0, on_reload=None, on_error=None):
+        self.ini_cls = ini_cls
+        self.file_path = file_path
+        self.encoding = encoding
+        self.interval = interval
+        self.on_reload = on_reload
+        self.on_error = on_error
+        self.config = ini_cls.load(file_path, encoding)
+        self._version = self._get_version()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _get_version(self):
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def check(self):
+        """Reload now if the file changed, return True if the config was replaced"""
+        version = self._get_version()
+        if version is None or version == self._version:
+            return False
+        self._version = version
+        try:
+            config = self.ini_cls.load(self.file_path, self.encoding)
+        except INI_Error as e:
+            if self.on_error is not None:
+                self.on_error(e)
+            return False
+        self.config = config
+        if self.on_reload is not None:
+            self.on_reload(config)
+        return True
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='INIWatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.stop()
+
+
 """
 Examples
 --------
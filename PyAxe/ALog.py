@@ -90,6 +90,7 @@ def _getLogFileObjectForAppend():
     return fp
 
 getLogFileObjectForAppend = _getLogFileObjectForAppend
+getLogFilePath = _formatLogFilePath
 
 def _log(level, msg, args):
     rawMsg = msg.msg if isinstance(msg, _ColorMsgPair) else msg
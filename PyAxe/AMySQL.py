@@ -4,7 +4,6 @@ from . import (AError, ACommandLineTool)
 
 
 _commandlineTool = ACommandLineTool.CommandLineTool('mysql')
-_commandlineTool.checkExistence()
 def getCommandLineTool():
     return _commandlineTool
 
@@ -1,6 +1,12 @@
 import os
 import io
 import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
 import subprocess
 import shlex
 import locale
@@ -229,6 +235,32 @@ def systemOutput(cmd, encoding=None, shell=False):
         raise OS_SystemOutputError(cmd, e.returncode, e.output.decode(encoding))
 
 
+def systemStream(cmd, chunkSize=64*1024):
+    """
+    Execute command and yield it's stdout(bytes chunks) while it is running
+    closing the generator early kills the process
+    raise OS_SystemOutputError(output is stderr) on failure
+    """
+    with tempfile.TemporaryFile() as errFile:
+        pipe = subprocess.Popen(cmd if os.name == 'nt' else shlex.split(cmd),
+                                stdout=subprocess.PIPE, stderr=errFile)
+        try:
+            while True:
+                data = pipe.stdout.read1(chunkSize)
+                if not data:
+                    break
+                yield data
+            code = pipe.wait()
+            if code != 0:
+                errFile.seek(0)
+                raise OS_SystemOutputError(cmd, code, errFile.read().decode(errors='replace'))
+        finally:
+            if pipe.poll() is None:
+                pipe.kill()
+            pipe.stdout.close()
+            pipe.wait()
+
+
 def removeFile(file):
     """
     :param file: 可以为普通文件或符号链接，也可包含通配符
@@ -502,6 +534,217 @@ def walkDirs(dir, dirMatchRule=None):
                 yield dirName, dirPath
 
 
+class _InotifyWatcher:
+    """基于Linux inotify（通过ctypes调用libc）的目录监视"""
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    _EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+    _libc = None
+
+    @classmethod
+    def isSupported(cls):
+        if not sys.platform.startswith('linux'):
+            return False
+        if cls._libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+            except (OSError, AttributeError):
+                return False
+            cls._libc = libc
+        return True
+
+    def __init__(self, dirs, fileMatchRule):
+        self.fileMatchRule = fileMatchRule
+        self.wdToDir = {}
+        self.files = set()  # 已知的（满足fileMatchRule的）文件，目录移走时据此报告其中的文件
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, 'inotify_init1: ' + os.strerror(err))
+        for dir in dirs:
+            self._addWatchRecursive(dir)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _addWatch(self, dir):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir), self.WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):  # 目录已被删除
+                return
+            raise OSError(err, 'inotify_add_watch(%s): %s' % (dir, os.strerror(err)))
+        self.wdToDir[wd] = dir
+
+    def _addWatchRecursive(self, dir):
+        """监视dir及其子目录，返回其中已有的文件"""
+        self._addWatch(dir)
+        for _, dirPath in walkDirs(dir):
+            self._addWatch(dirPath)
+        files = set(filePath for _, filePath in walkFiles(dir, self.fileMatchRule))
+        self.files.update(files)
+        return files
+
+    def _removeWatchRecursive(self, dir, changes):
+        """目录被移走或删除：去掉dir及其子目录的监视，其中已知的文件都作为变化（与轮询方式一致，视为被删除）"""
+        prefix = os.path.join(dir, '')
+        for wd, watchedDir in list(self.wdToDir.items()):
+            if watchedDir == dir or watchedDir.startswith(prefix):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self.wdToDir[wd]
+        removedFiles = set(filePath for filePath in self.files if filePath.startswith(prefix))
+        self.files -= removedFiles
+        changes.update(removedFiles)
+
+    def rescan(self, dirs):
+        """事件丢失后重新扫描，返回所有可能变化的文件（之前已知的和现有的）"""
+        changes = self.files
+        self.files = set()
+        for dir in dirs:
+            self._addWatchRecursive(dir)
+        return changes | self.files
+
+    def _match(self, filePath):
+        return self.fileMatchRule is None or self.fileMatchRule(os.path.basename(filePath), filePath)
+
+    def readEvents(self, changes):
+        """读取当前所有可读事件并加入changes，返回是否需要全量重新扫描（事件队列溢出）"""
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+
+        overflow = False
+        headerSize = self._EVENT_HEADER.size
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, nameLen = self._EVENT_HEADER.unpack_from(buf, offset)
+            name = os.fsdecode(buf[offset+headerSize:offset+headerSize+nameLen].rstrip(b'\0'))
+            offset += headerSize + nameLen
+
+            if mask & self.IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & self.IN_IGNORED:
+                self.wdToDir.pop(wd, None)
+                continue
+            dir = self.wdToDir.get(wd)
+            if dir is None:
+                continue
+            if mask & (self.IN_MOVE_SELF | self.IN_DELETE_SELF):
+                # 被监视的目录本身被移走或删除（如监视的根目录）
+                self._removeWatchRecursive(dir, changes)
+                continue
+            if not name:
+                continue
+
+            path = os.path.join(dir, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # 新目录中可能在加监视之前就已经有文件了
+                    changes.update(self._addWatchRecursive(path))
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    # 目录移走时不会有其中文件的事件，旧路径下的监视也要去掉
+                    self._removeWatchRecursive(path, changes)
+            elif self._match(path):
+                if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    self.files.discard(path)
+                else:
+                    self.files.add(path)
+                changes.add(path)
+        return overflow
+
+    def wait(self, timeout):
+        """等待可读，返回是否有事件"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(readable)
+
+
+def _snapshotFiles(dirs, fileMatchRule):
+    snapshot = {}
+    for dir in dirs:
+        for _, filePath in walkFiles(dir, fileMatchRule):
+            try:
+                stat = os.stat(filePath)
+            except OSError:
+                continue
+            snapshot[filePath] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def _diffSnapshot(old, new):
+    changes = set(path for path, value in new.items() if old.get(path) != value)
+    changes.update(path for path in old if path not in new)
+    return changes
+
+
+def watch(dirs, fileMatchRule=None, settle=0.05, pollInterval=1.0, usePolling=False):
+    """
+    监视目录（递归）中文件的变化（新建、修改、删除、移动），每次返回一批发生变化的文件路径集合(set)
+    Linux上使用inotify，其他平台（或usePolling=True）使用轮询os.stat
+    连续的变化会被合并：收到变化后，直到settle秒内没有新的变化才返回这一批
+    dirs: 目录或目录列表
+    fileMatchRule(fileName, filePath)是一个布尔值的函数，只返回满足条件的文件
+    pollInterval: 轮询方式的扫描间隔（秒）
+    example:
+        for changedFiles in AOS.watch('Source', lambda name, path: name.endswith('.proto')):
+            regenerate(changedFiles)
+    """
+    dirs = [dirs] if isinstance(dirs, str) else list(dirs)
+
+    if not usePolling and _InotifyWatcher.isSupported():
+        watcher = _InotifyWatcher(dirs, fileMatchRule)
+        try:
+            while True:
+                watcher.wait(None)
+                changes = set()
+                overflow = watcher.readEvents(changes)
+                while watcher.wait(settle):
+                    overflow = watcher.readEvents(changes) or overflow
+                if overflow:
+                    ALog.warn('watch: inotify event queue overflow, report all files')
+                    changes.update(watcher.rescan(dirs))
+                if changes:
+                    yield changes
+        finally:
+            watcher.close()
+    else:
+        snapshot = _snapshotFiles(dirs, fileMatchRule)
+        while True:
+            time.sleep(pollInterval)
+            newSnapshot = _snapshotFiles(dirs, fileMatchRule)
+            changes = _diffSnapshot(snapshot, newSnapshot)
+            while changes:
+                # 等到不再变化为止，把这期间的变化合并成一批
+                time.sleep(settle)
+                settledSnapshot = _snapshotFiles(dirs, fileMatchRule)
+                moreChanges = _diffSnapshot(newSnapshot, settledSnapshot)
+                newSnapshot = settledSnapshot
+                if not moreChanges:
+                    break
+                changes.update(moreChanges)
+            snapshot = newSnapshot
+            if changes:
+                yield changes
+
+
 def dirDiff(srcDir, dstDir, excludes=None):
     """
     比较两个目录的结构差异
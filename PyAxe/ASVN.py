@@ -1,12 +1,20 @@
 import os
+import re
+import json
+import stat
+import shutil
+import time
+import threading
 import xml.etree.ElementTree as ET
 import sqlite3
 import tempfile
-from . import (AError, ACommandLineTool, AOS)
+import datetime
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from . import (AError, ACommandLineTool, AOS, ALog)
 
 
 _commandlineTool = ACommandLineTool.CommandLineTool('svn')
-_commandlineTool.checkExistence()
 def getCommandLineTool():
     return _commandlineTool
 
@@ -47,6 +55,15 @@ class SVN_BranchDestinationAlreadyExistError(SVN_Error):
     def __str__(self):
         return "svn: branch destination '%s' already exist" % self.dst
 
+class SVN_CheckoutOrUpdateManyError(SVN_Error):
+    def __init__(self, errors):
+        self.errors = errors  # [(path, exception), ...]
+
+    def __str__(self):
+        return 'svn: checkout/update failed for %d working copies:\n%s' % (
+            len(self.errors), '\n'.join('  %s: %s' % (path, e) for path, e in self.errors)
+        )
+
 
 RESOLVE_ACCEPT_BASE = 'base'
 RESOLVE_ACCEPT_WORKING = 'working'
@@ -91,6 +108,281 @@ def execOutputSubCommand(cmdline):
     return _commandlineTool.execOutputCommand(cmdline)
 
 
+class RevisionCache:
+    """
+    infoDict/log结果缓存，只缓存URL在固定版本号上的查询（结果不会再变），HEAD/BASE等仍然访问svn
+    - 内存缓存，dbPath不为None时同时持久化到sqlite文件，供后续进程复用
+    - 结果以json保存，每次命中返回新的对象，调用者可以随意修改
+    - 注意：通过propset --revprop修改历史提交的日志/作者后需要clear()
+    """
+    def __init__(self, dbPath=None):
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if dbPath is not None:
+            try:
+                self._conn = sqlite3.connect(dbPath, check_same_thread=False)
+                self._conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                                   '(kind TEXT, key TEXT, value TEXT, PRIMARY KEY (kind, key))')
+                self._conn.commit()
+            except sqlite3.Error as e:
+                raise SVN_Error("svn: can't open revision cache '%s': %s" % (dbPath, e))
+
+    def get(self, kind, key):
+        with self._lock:
+            value = self._memory.get((kind, key))
+            if value is None and self._conn is not None:
+                row = self._conn.execute('SELECT value FROM cache WHERE kind=? AND key=?', (kind, key)).fetchone()
+                if row is not None:
+                    value = row[0]
+                    self._memory[(kind, key)] = value
+        return None if value is None else json.loads(value)
+
+    def set(self, kind, key, result):
+        value = json.dumps(result)
+        with self._lock:
+            self._memory[(kind, key)] = value
+            if self._conn is not None:
+                self._conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (kind, key, value))
+                self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM cache')
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_revisionCache = RevisionCache()
+def getRevisionCache():
+    return _revisionCache
+
+def setRevisionCache(cache):
+    """
+    :param cache: RevisionCache对象，None表示关闭缓存
+        例：ASVN.setRevisionCache(ASVN.RevisionCache('svn_cache.db'))
+    """
+    global _revisionCache
+    _revisionCache = cache
+
+
+def toRevisionNumber(revision):
+    """固定的版本号返回int，HEAD/BASE/COMMITTED/PREV/{DATE}等返回None"""
+    if isinstance(revision, bool):
+        return None
+    if isinstance(revision, int):
+        return revision
+    if isinstance(revision, str) and revision.isdigit():
+        return int(revision)
+    return None
+
+def _getPegRevision(url):
+    """URL最后一段中有@时返回其peg版本号(str)，否则返回None"""
+    lastPart = url.rstrip('/').rsplit('/', 1)[-1]
+    if '@' not in lastPart:
+        return None
+    return lastPart.rsplit('@', 1)[1]
+
+def _pegRevision(pathOrURL, revision):
+    """
+    URL在固定版本号(范围)上的查询使用URL@N（peg版本号），否则svn以HEAD为peg版本号，
+    路径在HEAD被删除/替换/移动后结果会变化甚至失败，缓存也就不再成立
+    调用者已指定peg版本号的URL保持不变
+    """
+    if not isURL(pathOrURL) or _getPegRevision(pathOrURL) is not None:
+        return pathOrURL
+    if isinstance(revision, tuple) or isinstance(revision, list):
+        numbers = [toRevisionNumber(item) for item in revision]
+        if None in numbers:
+            return pathOrURL
+        return '%s@%d' % (pathOrURL, max(numbers))
+    number = toRevisionNumber(revision)
+    if number is None:
+        return pathOrURL
+    return '%s@%d' % (pathOrURL, number)
+
+def _makeCacheKey(pathOrURL, revision, *args):
+    """
+    只有URL加固定版本号(或固定版本号范围)的查询可以缓存，否则返回None
+    URL自带peg版本号时，peg也必须是固定版本号（作为key的一部分）
+    """
+    if _revisionCache is None or not isURL(pathOrURL):
+        return None
+    peg = _getPegRevision(pathOrURL)
+    if peg is not None and toRevisionNumber(peg) is None:
+        return None
+    if isinstance(revision, tuple) or isinstance(revision, list):
+        revision = [toRevisionNumber(item) for item in revision]
+        if None in revision:
+            return None
+    else:
+        revision = toRevisionNumber(revision)
+        if revision is None:
+            return None
+    return json.dumps([pathOrURL, revision] + list(args))
+
+
+class WorkingCopyDB:
+    """
+    直接读取工作拷贝的.svn/wc.db（只读），不启动svn进程
+    - 只支持已知的格式版本(SUPPORTED_FORMATS)，其他情况由调用者回退到命令行
+    - 同一个wc.db的所有查询共用一个sqlite连接，见getWorkingCopyDB
+    """
+    SUPPORTED_FORMATS = (29, 30, 31)  # svn 1.7 ~ 1.14
+
+    def __init__(self, wcRoot):
+        self.wcRoot = wcRoot
+        self.dbPath = os.path.join(wcRoot, '.svn', 'wc.db')
+        self._lock = threading.Lock()
+        uri = 'file:%s?mode=ro' % urllib.parse.quote(os.path.abspath(self.dbPath).replace('\\', '/'))
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.format = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        self.wcId = None
+        if self.isSupported():
+            row = self._conn.execute('SELECT id FROM WCROOT WHERE local_abspath IS NULL').fetchone()
+            self.wcId = row[0] if row is not None else 1
+
+    def isSupported(self):
+        return self.format in WorkingCopyDB.SUPPORTED_FORMATS
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql, args):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def isVersioned(self, relpath):
+        rows = self._query("SELECT 1 FROM NODES WHERE wc_id=? AND local_relpath=? "
+                           "AND presence IN ('normal', 'incomplete') LIMIT 1", (self.wcId, relpath))
+        return len(rows) > 0
+
+    def infoDict(self, relpath, path):
+        """
+        返回与ASVN.infoDict相同结构的字典，
+        节点有本地增删/替换、为外联文件或不存在时返回None（需要用命令行获取）
+        """
+        rows = self._query(
+            'SELECT op_depth, presence, kind, depth, revision, repos_path, file_external, '
+            'changed_revision, changed_date, changed_author, root, uuid, REPOSITORY.id '
+            'FROM NODES LEFT JOIN REPOSITORY ON NODES.repos_id=REPOSITORY.id '
+            'WHERE wc_id=? AND local_relpath=? ORDER BY op_depth', (self.wcId, relpath))
+        if len(rows) != 1:
+            return None
+        (opDepth, presence, kind, depth, revision, reposPath, fileExternal,
+         changedRevision, changedDate, changedAuthor, root, uuid, reposId) = rows[0]
+        if opDepth != 0 or presence != 'normal' or fileExternal is not None or root is None:
+            return None
+
+        relativeURL = urllib.parse.quote(reposPath, safe="/!$&'()*+,;=:@~")
+        ret = {}
+        ret['#kind'] = kind
+        ret['#path'] = path
+        ret['#revision'] = revision
+        ret['url'] = root + ('/' + relativeURL if relativeURL else '')
+        ret['repo'] = {'root': root, 'uuid': uuid}
+        ret['relative-url'] = '^/' + relativeURL
+        ret['wc-info'] = {
+            'wcroot-abspath': os.path.abspath(self.wcRoot).replace('\\', '/'),
+            'uuid': 'normal',  # 与infoDict一致，实际为schedule
+            'depth': depth if kind == 'dir' and depth else 'infinity',
+        }
+        commit = {'#revision': changedRevision}
+        ret['commit'] = commit
+        if changedAuthor is not None:
+            commit['author'] = changedAuthor
+        commit['date'] = _formatAprTime(changedDate)
+
+        lockRows = self._query('SELECT lock_token, lock_owner, lock_comment, lock_date FROM LOCK '
+                               'WHERE repos_id=? AND repos_relpath=?', (reposId, reposPath))
+        if lockRows:
+            token, owner, comment, date = lockRows[0]
+            ret['lock'] = {
+                'token': token,
+                'owner': owner,
+                'comment': '' if comment is None else comment,
+                'created': _formatAprTime(date),
+            }
+        return ret
+
+
+def _formatAprTime(microseconds):
+    if microseconds is None:
+        return None
+    t = datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=microseconds)
+    return t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+_workingCopyDBs = {}
+_workingCopyDBsLock = threading.Lock()
+
+def getWorkingCopyDB(path):
+    """
+    :return: (WorkingCopyDB, path相对于工作拷贝根目录的路径)，
+        path不在工作拷贝中、wc.db无法打开或格式未知时返回(None, None)
+    """
+    absPath = os.path.abspath(path)
+    wcRoot = absPath
+    while not os.path.isfile(os.path.join(wcRoot, '.svn', 'wc.db')):
+        parent = os.path.dirname(wcRoot)
+        if parent == wcRoot:
+            return (None, None)
+        wcRoot = parent
+
+    try:
+        stat = os.stat(os.path.join(wcRoot, '.svn', 'wc.db'))
+    except OSError:
+        return (None, None)
+    with _workingCopyDBsLock:
+        cached = _workingCopyDBs.get(wcRoot)
+        if cached is None or cached[0] != stat.st_ino:  # wc.db被替换(重新checkout等)后重新打开
+            try:
+                db = WorkingCopyDB(wcRoot)
+            except sqlite3.Error:
+                return (None, None)
+            if cached is not None:
+                cached[1].close()
+            cached = (stat.st_ino, db)
+            _workingCopyDBs[wcRoot] = cached
+    db = cached[1]
+    if not db.isSupported():
+        return (None, None)
+    relpath = '' if absPath == wcRoot else os.path.relpath(absPath, wcRoot).replace('\\', '/')
+    return (db, relpath)
+
+def closeWorkingCopyDB(path):
+    """
+    关闭path所在的工作拷贝，以及path下所有工作拷贝的wc.db连接（之后用到时会重新打开）
+    删除或重新checkout工作拷贝之前需要调用（Windows上打开的wc.db无法删除）
+    """
+    absPath = os.path.abspath(path)
+    with _workingCopyDBsLock:
+        for wcRoot in list(_workingCopyDBs):
+            if (wcRoot == absPath or wcRoot.startswith(os.path.join(absPath, ''))
+                    or absPath.startswith(os.path.join(wcRoot, ''))):
+                _workingCopyDBs.pop(wcRoot)[1].close()
+
+def closeAllWorkingCopyDBs():
+    with _workingCopyDBsLock:
+        for _, db in _workingCopyDBs.values():
+            db.close()
+        _workingCopyDBs.clear()
+
+
+_SCHEME_PATTERN = re.compile(r'^[A-Za-z][\w+.-]*://')
+
+def _isLocalPath(path):
+    """可以直接读取wc.db的本地路径：没有scheme://前缀（svn+ssh://、file:///等）并且存在"""
+    return not _SCHEME_PATTERN.match(path) and os.path.lexists(path)
+
 def isURL(url):
     for prefix in ('file:\\\\\\', 'svn://', 'http://', 'https://'):
         if url.startswith(prefix):
@@ -98,6 +390,14 @@ def isURL(url):
     return False
 
 def isSVNPath(path, userpass=None):
+    if _isLocalPath(path):
+        db, relpath = getWorkingCopyDB(path)
+        if db is not None:
+            try:
+                return db.isVersioned(relpath)
+            except sqlite3.Error:
+                pass
+
     cmd = 'info'
     cmd += ' ' + path
     cmd += makeUserPassOptionStr(userpass)
@@ -108,10 +408,34 @@ def isSVNPath(path, userpass=None):
     return True
 
 
-def infoDict(pathOrURL, revision=None, userpass=None):
+def infoDict(pathOrURL, revision=None, userpass=None, useCache=True):
     """
     :param pathOrURL: working copy path or remote url
+    :param useCache: URL在固定版本号上的结果从RevisionCache获取，见setRevisionCache
+        工作拷贝路径且未指定版本号时直接读取wc.db，见WorkingCopyDB
+    URL未指定peg版本号时（无论useCache），以固定的revision作为peg版本号查询
     """
+    if revision is None and _isLocalPath(pathOrURL):
+        db, relpath = getWorkingCopyDB(pathOrURL)
+        if db is not None:
+            try:
+                ret = db.infoDict(relpath, os.path.normpath(pathOrURL))
+            except sqlite3.Error:
+                ret = None
+            if ret is not None:
+                return ret
+
+    key = _makeCacheKey(pathOrURL, revision) if useCache else None
+    if key is not None:
+        ret = _revisionCache.get('info', key)
+        if ret is not None:
+            return ret
+    ret = _infoDict(_pegRevision(pathOrURL, revision), revision, userpass)
+    if key is not None:
+        _revisionCache.set('info', key, ret)
+    return ret
+
+def _infoDict(pathOrURL, revision, userpass):
     cmd = 'info'
     cmd += ' ' + pathOrURL
     cmd += ' --xml'
@@ -119,8 +443,9 @@ def infoDict(pathOrURL, revision=None, userpass=None):
     cmd += ' ' + makeUserPassOptionStr(userpass)
     result = execOutputSubCommand(cmd)
     root = ET.fromstring(result)
-    entryNode = root.find('entry')
+    return _parseInfoEntry(root.find('entry'))
 
+def _parseInfoEntry(entryNode):
     ret = {}
     ret['#kind'] = entryNode.attrib['kind']
     ret['#path'] = entryNode.attrib['path']
@@ -172,6 +497,7 @@ def infoDict(pathOrURL, revision=None, userpass=None):
     return ret
 
 def checkout(url, path, revision=None, userpass=None):
+    closeWorkingCopyDB(path)
     cmd = 'checkout'
     cmd += ' ' + url + ' ' + path
     cmd += ' ' + makeRevisionOptionStr(revision)
@@ -191,6 +517,75 @@ def checkoutOrUpdate(url, path, revision=None, userpass=None):
     else:
         checkout(url, path, revision, userpass)
 
+# 网络类错误，重试可能成功
+_TRANSIENT_ERROR_CODES = ('E170013', 'E175002', 'E175012', 'E000104', 'E000110', 'E000111', 'E670002', 'E670008', 'E210002')
+# 工作拷贝被锁或上次操作未完成，cleanup后可以继续
+_WORKING_COPY_LOCKED_ERROR_CODES = ('E155004', 'E155037')
+
+def _checkoutOrUpdateOne(url, path, revision, userpass, retry, retryDelay, autoCleanup):
+    prefix = '[%s]' % path
+    attempt = 0
+    while True:
+        if os.path.exists(path):
+            cmd = 'update'
+            cmd += ' ' + path
+        else:
+            closeWorkingCopyDB(path)
+            cmd = 'checkout'
+            cmd += ' ' + url + ' ' + path
+        cmd += ' ' + makeRevisionOptionStr(revision)
+        cmd += ' ' + makeUserPassOptionStr(userpass)
+        ALog.info('%s >>> svn %s', prefix, cmd)
+        try:
+            output = execOutputSubCommand(cmd)
+        except AOS.OS_SystemOutputError as e:
+            for line in e.output.splitlines():
+                ALog.error('%s %s', prefix, line)
+            if attempt >= retry:
+                raise
+            attempt += 1
+            if autoCleanup and any(code in e.output for code in _WORKING_COPY_LOCKED_ERROR_CODES):
+                ALog.warn('%s working copy locked, cleanup and retry (%d/%d)', prefix, attempt, retry)
+                try:
+                    cleanup(path)
+                except AOS.OS_SystemError:
+                    clearWorkQueue(path)
+                    cleanup(path)
+            elif any(code in e.output for code in _TRANSIENT_ERROR_CODES):
+                delay = retryDelay * 2 ** (attempt - 1)
+                ALog.warn('%s transient failure, retry in %.1fs (%d/%d)', prefix, delay, attempt, retry)
+                time.sleep(delay)
+            else:
+                raise
+        else:
+            for line in output.splitlines():
+                ALog.info('%s %s', prefix, line)
+            return
+
+def checkoutOrUpdateMany(specs, jobs=4, userpass=None, retry=3, retryDelay=1.0, autoCleanup=False):
+    """
+    并发checkout/update多个工作拷贝
+    :param specs: list of (url, path[, revision])
+    :param jobs: 同时执行的svn进程数
+    :param retry: 网络类错误（连接失败/超时等）的重试次数，每次等待时间翻倍
+    :param autoCleanup: 工作拷贝被锁(E155004/E155037)时执行cleanup（失败再clearWorkQueue）后重试
+    :except:
+        SVN_CheckoutOrUpdateManyError: 所有工作拷贝执行完后汇总失败的
+    """
+    def run(spec):
+        url, path = spec[0], spec[1]
+        revision = spec[2] if len(spec) > 2 else None
+        try:
+            _checkoutOrUpdateOne(url, path, revision, userpass, retry, retryDelay, autoCleanup)
+        except Exception as e:
+            return (path, e)
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        errors = [error for error in executor.map(run, specs) if error is not None]
+    if errors:
+        raise SVN_CheckoutOrUpdateManyError(errors)
+
 def export(pathOrURL, path, revision=None, userpass=None):
     cmd = 'export'
     cmd += ' ' + pathOrURL + ' ' + path
@@ -216,10 +611,16 @@ def clearWorkQueue(path):
     Do this action maybe useful if cleanup failed
     :param path: must be a working-copy root dir
     """
+    closeWorkingCopyDB(path)
     conn = sqlite3.connect(os.path.join(path, '.svn', 'wc.db'))
-    conn.execute('DELETE FROM work_queue')
+    try:
+        conn.execute('DELETE FROM work_queue')
+        conn.commit()
+    finally:
+        conn.close()
 
 def cleanup(path):
+    closeWorkingCopyDB(path)
     execSubCommand('cleanup %s' % path)
 
 def revert(path, recursive=True):
@@ -252,7 +653,7 @@ def commit(path, includeExternals=False, message=None, userpass=None):
     cmd += ' ' + makeUserPassOptionStr(userpass)
     execSubCommand(cmd)
 
-def log(pathOrURL, limit=None, verbose=False, searchPattern=None, revision=None, userpass=None):
+def log(pathOrURL, limit=None, verbose=False, searchPattern=None, revision=None, userpass=None, useCache=True):
     """
     :param pathOrURL: working copy path or remote url
     :param limit: when the revision is a range, limit the record count
@@ -272,7 +673,20 @@ def log(pathOrURL, limit=None, verbose=False, searchPattern=None, revision=None,
             - for (5, 10): return list ordered by 5 -> 10
             - for (10, 5): return list ordered by 10 -> 5
             - the bound revision 5 or 10 also included
+    :param useCache: URL在固定版本号(范围)上的结果从RevisionCache获取，见setRevisionCache
+    URL未指定peg版本号时（无论useCache），以固定的revision(范围中较大的)作为peg版本号查询
     """
+    key = _makeCacheKey(pathOrURL, revision, limit, verbose, searchPattern) if useCache else None
+    if key is not None:
+        ret = _revisionCache.get('log', key)
+        if ret is not None:
+            return ret
+    ret = _log(_pegRevision(pathOrURL, revision), limit, verbose, searchPattern, revision, userpass)
+    if key is not None:
+        _revisionCache.set('log', key, ret)
+    return ret
+
+def _makeLogCmd(pathOrURL, limit, verbose, searchPattern, revision, userpass):
     cmd = 'log'
     cmd += ' ' + pathOrURL
     cmd += ' --xml'
@@ -284,8 +698,13 @@ def log(pathOrURL, limit=None, verbose=False, searchPattern=None, revision=None,
         cmd += ' --search %s' % searchPattern
     cmd += ' ' + makeRevisionOptionStr(revision)
     cmd += ' ' + makeUserPassOptionStr(userpass)
+    return cmd
 
-    result = execOutputSubCommand(cmd)
+def _log(pathOrURL, limit, verbose, searchPattern, revision, userpass):
+    cmd = _makeLogCmd(pathOrURL, limit, verbose, searchPattern, revision, userpass)
+    return _parseLog(execOutputSubCommand(cmd))
+
+def _parseLog(result):
     root = ET.fromstring(result)
 
     ret = []
@@ -310,10 +729,144 @@ def log(pathOrURL, limit=None, verbose=False, searchPattern=None, revision=None,
                 path['#action'] = path_node.attrib['action']
     return ret
 
-def removeNotVersioned(path):
-    for line in execOutputSubCommand('status ' + path).splitlines():
-        if len(line) > 0 and line[0] == '?':
-            AOS.removePath(line[8:])
+def iterXMLSubCommand(cmdline, tag):
+    """
+    执行svn子命令，边读取xml输出边解析，逐个yield标签为tag的结点（yield之后结点被清空，不要保留引用）
+    生成器提前关闭（break/close）时结束svn进程，通过CommandLineTool.execStreamCommand执行
+    :except:
+        AOS.OS_SystemOutputError: svn返回错误
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    stack = []
+    chunks = _commandlineTool.execStreamCommand(cmdline + ' --non-interactive')
+    try:
+        for data in chunks:
+            parser.feed(data)
+            for event, node in parser.read_events():
+                if event == 'start':
+                    stack.append(node)
+                    continue
+                stack.pop()
+                if node.tag == tag:
+                    yield node
+                    node.clear()
+                    if stack:
+                        stack[-1].remove(node)
+    finally:
+        chunks.close()
+    parser.close()
+
+
+class LogPath:
+    __slots__ = ('path', 'action', 'kind', 'textMods', 'propMods')
+
+    def __init__(self, path, action, kind, textMods, propMods):
+        self.path = path
+        self.action = action
+        self.kind = kind
+        self.textMods = textMods
+        self.propMods = propMods
+
+    def __repr__(self):
+        return 'LogPath(%s %s)' % (self.action, self.path)
+
+
+class LogEntry:
+    __slots__ = ('revision', 'author', 'date', 'msg', 'paths')
+
+    def __init__(self, revision, author, date, msg, paths):
+        self.revision = revision
+        self.author = author
+        self.date = date
+        self.msg = msg
+        self.paths = paths  # list of LogPath, verbose为False时为None
+
+    def __repr__(self):
+        return 'LogEntry(r%d %s)' % (self.revision, self.author)
+
+    def toDict(self):
+        """转换为log()返回的字典格式"""
+        ret = {'#revision': str(self.revision), 'author': self.author, 'date': self.date, 'msg': self.msg}
+        if self.paths is not None:
+            ret['paths'] = [{
+                '#': path.path,
+                '#prop-mods': path.propMods,
+                '#text-mods': path.textMods,
+                '#kind': path.kind,
+                '#action': path.action,
+            } for path in self.paths]
+        return ret
+
+
+def iterLog(pathOrURL, limit=None, verbose=False, searchPattern=None, revision=None, userpass=None):
+    """
+    与log()参数相同，流式解析svn log --xml输出，逐条yield LogEntry，内存占用与日志总量无关
+    提前结束迭代（如break）会结束svn进程
+    例：
+        for entry in ASVN.iterLog(url, verbose=True):
+            if entry.author == 'someone':
+                break
+    """
+    cmd = _makeLogCmd(pathOrURL, limit, verbose, searchPattern, revision, userpass)
+    for node in iterXMLSubCommand(cmd, 'logentry'):
+        pathsNode = node.find('paths')
+        paths = None
+        if pathsNode is not None:
+            paths = []
+            for pathNode in pathsNode.iterfind('path'):
+                attrib = pathNode.attrib
+                paths.append(LogPath(pathNode.text, attrib['action'], attrib['kind'],
+                                     attrib['text-mods'] == 'true', attrib['prop-mods'] == 'true'))
+        yield LogEntry(int(node.attrib['revision']), node.findtext('author'), node.findtext('date'),
+                       node.findtext('msg'), paths)
+
+def _onRemoveError(func, path, excInfo):
+    # 只读文件（Windows上还有隐藏文件）去掉只读属性后重试
+    os.chmod(path, stat.S_IWRITE | stat.S_IREAD | stat.S_IEXEC)
+    func(path)
+
+def _removeUnversioned(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        closeWorkingCopyDB(path)  # 未版本控制的目录可能是嵌套的工作拷贝
+        shutil.rmtree(path, onerror=_onRemoveError)
+    else:
+        try:
+            os.remove(path)
+        except PermissionError:
+            _onRemoveError(os.remove, path, None)
+
+def iterStatus(path, includeIgnored=False, quiet=False):
+    """
+    流式解析svn status --xml，逐个yield (path, item)
+    item为wc-status的item属性：unversioned/ignored/modified/added/deleted/missing/external/...
+    未版本控制的目录只返回目录本身，不会列出其中内容
+    """
+    cmd = 'status'
+    cmd += ' ' + path
+    cmd += ' --xml'
+    if includeIgnored:
+        cmd += ' --no-ignore'
+    if quiet:
+        cmd += ' -q'
+    for node in iterXMLSubCommand(cmd, 'entry'):
+        yield (node.attrib['path'], node.find('wc-status').attrib['item'])
+
+def removeNotVersioned(path, includeIgnored=False, jobs=8):
+    """
+    删除path下未版本控制的文件和目录（目录整个删除）
+    :param includeIgnored: 同时删除被svn:ignore/global-ignores忽略的
+    :param jobs: 删除线程数
+    :return: 删除的文件和目录数
+    """
+    items = ('unversioned', 'ignored') if includeIgnored else ('unversioned',)
+    futures = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for entryPath, item in iterStatus(path, includeIgnored):
+            if item in items:
+                futures.append(executor.submit(_removeUnversioned, entryPath))
+    for future in futures:
+        future.result()
+    return len(futures)
 
 def propset(path, key, value):
     execSubCommand('propset svn:%s %s %s' % (key, value, path))
@@ -388,18 +941,25 @@ def branch(src, dst, message=None, revision=None, userpass=None):
     cmd += ' ' + makeUserPassOptionStr(userpass)
     execSubCommand(cmd)
 
+def _resolveRevisionNumber(path, revision):
+    """固定版本号不需要再执行svn info"""
+    number = toRevisionNumber(revision)
+    if number is None:
+        number = infoDict(path, revision)['#revision']
+    return number
+
 def rollback(path, revision):
     """
     rollback path changes made by commits in revision
     """
     if isinstance(revision, tuple) or isinstance(revision, list):
-        startRevision = infoDict(path, revision[0])['#revision']
-        endRevision = infoDict(path, revision[1])['#revision']
+        startRevision = _resolveRevisionNumber(path, revision[0])
+        endRevision = _resolveRevisionNumber(path, revision[1])
         if startRevision < endRevision:
             startRevision, endRevision = endRevision, startRevision
         revision = (startRevision, endRevision-1) if isinstance(revision, tuple) else [startRevision, endRevision-1]
     else:
-        revision = infoDict(path, revision)['#revision']
+        revision = _resolveRevisionNumber(path, revision)
         revision = '-%d' % revision
 
     cmd = 'merge '
@@ -407,3 +967,168 @@ def rollback(path, revision):
     cmd += ' ' + path
     cmd += ' ' + path
     execSubCommand(cmd)
+
+
+def _execTargetsSubCommand(cmd, targets, output=False):
+    """
+    所有目标通过--targets文件传给一个svn进程，避免逐个执行以及命令行长度限制
+    """
+    with AOS.TempFile(''.join(target + '\n' for target in targets), echo=False) as f:
+        cmd += ' --targets ' + AOS.fixPathArg(f.path)
+        if output:
+            return execOutputSubCommand(cmd)
+        execSubCommand(cmd)
+
+def updateMany(paths, revision=None, userpass=None):
+    if not paths:
+        return
+    cmd = 'update'
+    cmd += ' ' + makeRevisionOptionStr(revision)
+    cmd += ' ' + makeUserPassOptionStr(userpass)
+    _execTargetsSubCommand(cmd, paths)
+
+def addMany(paths, force=True):
+    if not paths:
+        return
+    cmd = 'add'
+    if force:
+        cmd += ' --force'
+    _execTargetsSubCommand(cmd, paths)
+
+def revertMany(paths, recursive=True):
+    if not paths:
+        return
+    cmd = 'revert'
+    if recursive:
+        cmd += ' -R'
+    _execTargetsSubCommand(cmd, paths)
+
+def commitMany(paths, includeExternals=False, message=None, userpass=None):
+    """所有路径在同一次提交中"""
+    if not paths:
+        return
+    cmd = 'commit'
+    if includeExternals:
+        cmd += ' --include-externals'
+    cmd += ' ' + makeMessageOptionStr(message)
+    cmd += ' ' + makeUserPassOptionStr(userpass)
+    _execTargetsSubCommand(cmd, paths)
+
+def _findFailedTarget(targets, failedLines, userpass):
+    """
+    svn的警告中路径可能是仓库路径(/trunk/a.txt)，也可能是规范化后的本地路径，
+    因此按仓库路径以及本地绝对路径比较，返回第一个失败的目标，找不到返回None
+    """
+    quotedPaths = set()
+    for line in failedLines:
+        for quoted in re.findall(r"'([^']*)'", line):
+            quotedPaths.add(quoted)
+            if not isURL(quoted):
+                quotedPaths.add(os.path.normcase(os.path.abspath(quoted)))
+    try:
+        infos = infoDictMany(targets, userpass=userpass)
+    except (SVN_Error, AOS.OS_SystemOutputError):
+        infos = {}
+    for target in targets:
+        candidates = {target}
+        if not isURL(target):
+            candidates.add(os.path.normcase(os.path.abspath(target)))
+        info = infos.get(target)
+        if info is not None:
+            candidates.add(urllib.parse.unquote(info['relative-url'][1:]))
+            candidates.add(info['url'])
+        if candidates & quotedPaths:
+            return target
+    return None
+
+def lockMany(filePaths, message=None, userpass=None):
+    """
+    :except:
+        SVN_AlreadyLockedError: 第一个加锁失败的路径（其余路径仍然会被加锁）
+    """
+    if not filePaths:
+        return
+    cmd = 'lock'
+    cmd += ' ' + makeMessageOptionStr(message)
+    cmd += ' ' + makeUserPassOptionStr(userpass)
+    result = _execTargetsSubCommand(cmd, filePaths, output=True)
+    failedLines = [line for line in result.splitlines() if line.startswith('svn:')]
+    if not failedLines:
+        return
+    filePath = _findFailedTarget(filePaths, failedLines, userpass)
+    if filePath is None:
+        raise SVN_Error('svn: lock failed: %s' % '\n'.join(failedLines))
+    if isURL(filePath):
+        raise SVN_AlreadyLockedError(filePath, 'None', 'None', 'None')
+    info = infoDict(filePath, userpass=userpass)['lock']
+    raise SVN_AlreadyLockedError(filePath, info['owner'], info['comment'], info['created'])
+
+def infoDictMany(pathsOrURLs, revision=None, userpass=None, useCache=True):
+    """
+    :return: {pathOrURL: infoDict(pathOrURL)}
+        已在RevisionCache中的目标不再查询，其余的在一个svn进程中查询
+    """
+    ret = {}
+    keys = {}
+    targets = []
+    for pathOrURL in pathsOrURLs:
+        key = _makeCacheKey(pathOrURL, revision) if useCache else None
+        if key is not None:
+            cached = _revisionCache.get('info', key)
+            if cached is not None:
+                ret[pathOrURL] = cached
+                continue
+            keys[pathOrURL] = key
+        if pathOrURL not in targets:
+            targets.append(pathOrURL)
+    if not targets:
+        return ret
+
+    cmd = 'info'
+    cmd += ' --xml'
+    cmd += ' ' + makeRevisionOptionStr(revision)
+    cmd += ' ' + makeUserPassOptionStr(userpass)
+    root = ET.fromstring(_execTargetsSubCommand(cmd, [_pegRevision(target, revision) for target in targets], output=True))
+    entryNodes = root.findall('entry')
+    if len(entryNodes) != len(targets):  # svn按目标顺序输出entry
+        raise SVN_Error('svn: info returned %d entries for %d targets' % (len(entryNodes), len(targets)))
+    for pathOrURL, entryNode in zip(targets, entryNodes):
+        info = _parseInfoEntry(entryNode)
+        ret[pathOrURL] = info
+        if pathOrURL in keys:
+            _revisionCache.set('info', keys[pathOrURL], info)
+    return ret
+
+def logMany(pathOrURL, relativePaths, limit=None, searchPattern=None, revision=None, userpass=None):
+    """
+    一个svn进程查询pathOrURL下多个路径的日志（svn log URL PATH...）
+    :param pathOrURL: 工作拷贝路径会先转换为对应的URL（svn log不接受多个工作拷贝路径）
+    :param limit: 限制的是所有路径合并后的记录数
+    :return: {relativePath: [logentry, ...]}，每个logentry带有paths（即verbose），
+        一条提交修改了多个路径时会同时出现在它们的列表中
+    """
+    if not relativePaths:
+        return {}
+    info = infoDict(pathOrURL, userpass=userpass)
+    cmd = 'log'
+    cmd += ' --xml -v'
+    if limit is not None:
+        cmd += ' -l %s' % limit
+    if searchPattern is not None:
+        cmd += ' --search %s' % searchPattern
+    cmd += ' ' + makeRevisionOptionStr(revision)
+    cmd += ' ' + makeUserPassOptionStr(userpass)
+    logentries = _parseLog(_execTargetsSubCommand(cmd, [info['url']] + list(relativePaths), output=True))
+
+    # relative-url经过URI编码，而日志中的路径没有
+    baseRepoPath = urllib.parse.unquote(info['relative-url'][1:]).rstrip('/')
+    repoPaths = [(relativePath, baseRepoPath + '/' + relativePath.replace('\\', '/').strip('/'))
+                 for relativePath in relativePaths]
+    ret = {relativePath: [] for relativePath in relativePaths}
+    for logentry in logentries:
+        changedPaths = [path['#'] for path in logentry.get('paths', [])]
+        for relativePath, repoPath in repoPaths:
+            prefix = repoPath + '/'
+            if any(changedPath == repoPath or changedPath.startswith(prefix) for changedPath in changedPaths):
+                ret[relativePath].append(logentry)
+    return ret
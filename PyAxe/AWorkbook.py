@@ -1,15 +1,37 @@
 """
 用于 XML 电子表格 (2003) (*.xml)
 xml应以UTF-8编码
+另外支持读取CSV/TSV和xlsx，产生相同的Sheet/Row，并使用相同的校验规则
 """
+import io
+import os
+import re
+import csv
+import sys
+import mmap
+import time
+import array
+import pickle
+import zipfile
+import tempfile
 import xml.etree.ElementTree as ET
-from . import AError
+from concurrent.futures import ProcessPoolExecutor
+from . import ACore, AError, AFile, AHash, AOS
 
 
 ROW_NUMBER_SIGN = '#'  # 行号标识
 TITLE_ROW_INDEX = 1  # 第一行为标题行
 ROW_DISABLE_TAG = '<%%下架%%>'
 
+_SS_NS = '{urn:schemas-microsoft-com:office:spreadsheet}'
+_TAG_WORKSHEET = _SS_NS + 'Worksheet'
+_TAG_TABLE = _SS_NS + 'Table'
+_TAG_ROW = _SS_NS + 'Row'
+_TAG_CELL = _SS_NS + 'Cell'
+_TAG_DATA = _SS_NS + 'Data'
+_ATTR_INDEX = _SS_NS + 'Index'
+_ATTR_NAME = _SS_NS + 'Name'
+
 
 class Workbook_Error(AError.Error):
     pass
@@ -35,21 +57,54 @@ class Workbook_UniqueCheckError(Workbook_Error):
         return "'%s' 表，'%s' 列：第 %d 行 和 第 %d 行包含重复数据" % (self.sheet.name, self.title, self.row1['#'], self.row2['#'])
 
 
+class Workbook_ColumnValueError(Workbook_Error):
+    def __init__(self, sheet, title, rowNumber, value, reason):
+        self.sheet = sheet
+        self.title = title
+        self.rowNumber = rowNumber
+        self.value = value
+        self.reason = reason
+
+    def __str__(self):
+        return "'%s' 表，'%s' 列：第 %d 行的值 '%s' 无效：%s" % (self.sheet.name, self.title, self.rowNumber, self.value, self.reason)
+
+
 class Row:
-    def __init__(self, sheet, row):
+    """行对象：仅是对Sheet中第index行的引用（数据按列存储在Sheet中）"""
+    __slots__ = ('sheet', 'index')
+
+    def __init__(self, sheet, index):
         self.sheet = sheet
-        self.row = row
+        self.index = index
 
     def __getitem__(self, title):
         return self.get(title)
-    
+
+    def __setitem__(self, title, value):
+        self.set(title, value)
+
     def get(self, title):
         try:
             cellIndex = self.sheet._titleToCellIndexMap[title]
         except KeyError:
             raise Workbook_InvalidColumnError(self.sheet, title)
-        return self.row[cellIndex]
-    
+        return self.sheet._columns[cellIndex][self.index]
+
+    def set(self, title, value):
+        """修改title列的值（该列已建立的索引会失效）"""
+        try:
+            cellIndex = self.sheet._titleToCellIndexMap[title]
+        except KeyError:
+            raise Workbook_InvalidColumnError(self.sheet, title)
+        self.sheet._columns[cellIndex][self.index] = value
+        self.sheet.invalidateIndexes(title)
+
+    @property
+    def row(self):
+        """整行数据列表（第0列为行号）"""
+        index = self.index
+        return [column[index] for column in self.sheet._columns]
+
     @property
     def enabled(self):
         if ROW_DISABLE_TAG not in self.sheet._titleToCellIndexMap:
@@ -57,15 +112,442 @@ class Row:
         return self[ROW_DISABLE_TAG] != ROW_DISABLE_TAG
 
 
+class _DetachedRow(Row):
+    """不属于Sheet存储的行对象（流式读取时使用），数据保存在自身的列表中"""
+    __slots__ = ('_row',)
+
+    def __init__(self, sheet, row):
+        Row.__init__(self, sheet, None)
+        self._row = row
+
+    def get(self, title):
+        try:
+            cellIndex = self.sheet._titleToCellIndexMap[title]
+        except KeyError:
+            raise Workbook_InvalidColumnError(self.sheet, title)
+        return self._row[cellIndex]
+
+    def set(self, title, value):
+        try:
+            cellIndex = self.sheet._titleToCellIndexMap[title]
+        except KeyError:
+            raise Workbook_InvalidColumnError(self.sheet, title)
+        self._row[cellIndex] = value
+
+    @property
+    def row(self):
+        return self._row
+
+
+class _Column:
+    """
+    字典编码的列：values为去重后的值，codes为每行的值在values中的编号
+    重复值较多的列（如类型、开关等）每个单元格只占4字节
+    """
+    __slots__ = ('values', 'codes', '_codeMap')
+
+    def __init__(self):
+        self.values = []
+        self.codes = array.array('I')
+        self._codeMap = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.values[self.codes[index]]
+
+    def __setitem__(self, index, value):
+        self.codes[index] = self._encode(value)
+
+    def __getstate__(self):
+        return (self.values, self.codes)
+
+    def __setstate__(self, state):
+        self.values, self.codes = state
+        self._codeMap = None
+
+    def _encode(self, value):
+        codeMap = self._codeMap
+        if codeMap is None:
+            codeMap = self._codeMap = {v: code for code, v in enumerate(self.values)}
+        code = codeMap.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            codeMap[value] = code
+        return code
+
+    def append(self, value):
+        self.codes.append(self._encode(value))
+
+    def compact(self):
+        """数据加载完成后释放编码用的辅助字典"""
+        self._codeMap = None
+
+    def toList(self):
+        values = self.values
+        return [values[code] for code in self.codes]
+
+
+def _importNumpy():
+    try:
+        import numpy
+    except ImportError:
+        raise Workbook_Error('useNumpy=True 需要安装 numpy')
+    return numpy
+
+
+class Column:
+    """
+    列类型声明（用于Schema），把整列字符串一次性转换为类型化数组
+    title: 列标题，None表示与Schema中的属性名相同
+    default: 单元格为空时使用的值，None表示不允许为空
+    """
+    typecode = None  # array的类型码，None表示转换为list
+    numpyDType = object
+
+    def __init__(self, title=None, default=None):
+        self.title = title
+        self.default = default
+
+    def coerce(self, value):
+        return value
+
+    def toPythonValue(self, value):
+        if value == '':
+            if self.default is None:
+                raise ValueError('不能为空')
+            return self.default
+        return self.coerce(value)
+
+    def convert(self, sheet, title, useNumpy=False):
+        """
+        转换sheet中title列的所有值
+        每个不同的值只转换一次（列是字典编码的），再按编号展开为整列
+        """
+        try:
+            cellIndex = sheet._titleToCellIndexMap[title]
+        except KeyError:
+            raise Workbook_InvalidColumnError(sheet, title)
+        if cellIndex == 0:
+            raise Workbook_Error("'%s' 表，'%s' 列为行号列，不能转换" % (sheet.name, title))
+
+        column = sheet._columns[cellIndex]
+        converted = []
+        for code, value in enumerate(column.values):
+            try:
+                converted.append(self.toPythonValue(value))
+            except Exception as e:
+                position = column.codes.index(code)
+                raise Workbook_ColumnValueError(sheet, title, sheet._columns[0][position], value, e)
+
+        if useNumpy:
+            numpy = _importNumpy()
+            return numpy.asarray(converted, dtype=self.numpyDType)[numpy.frombuffer(column.codes, dtype=numpy.uint32)]
+
+        values = map(converted.__getitem__, column.codes)
+        if self.typecode is None:
+            return list(values)
+        return array.array(self.typecode, values)
+
+
+class IntColumn(Column):
+    typecode = 'q'
+    numpyDType = 'int64'
+    coerce = int
+
+
+class FloatColumn(Column):
+    typecode = 'd'
+    numpyDType = 'float64'
+    coerce = float
+
+
+class BoolColumn(Column):
+    """'1'/'true'/'yes'为真，'0'/'false'/'no'为假（不区分大小写）"""
+    typecode = 'b'
+    numpyDType = 'bool'
+
+    def coerce(self, value):
+        lower = value.strip().lower()
+        if lower in ('1', 'true', 'yes'):
+            return True
+        if lower in ('0', 'false', 'no'):
+            return False
+        raise ValueError('不是有效的布尔值')
+
+
+class StringColumn(Column):
+    def __init__(self, title=None, allowEmpty=True):
+        Column.__init__(self, title, '' if allowEmpty else None)
+
+
+class Schema:
+    """
+    表的列类型声明，load时把声明的每一列整体转换为类型化数组（array/list，或numpy数组）
+    example:
+        class ItemSchema(AWorkbook.Schema):
+            ID = AWorkbook.IntColumn()
+            Price = AWorkbook.FloatColumn('价格', default=0.0)
+            Name = AWorkbook.StringColumn(allowEmpty=False)
+
+        items = ItemSchema.load(book['Item'])
+        print(items.rowNumbers, items.ID, items.Price, items.Name)
+    """
+    @classmethod
+    def _getColumns(cls):
+        columns = cls.__dict__.get('_columns')
+        if columns is None:
+            columns = ACore.collectClassAttributes(cls, Column)
+            cls._columns = columns
+        return columns
+
+    @classmethod
+    def load(cls, sheet, useNumpy=False):
+        ret = cls()
+        ret.sheet = sheet
+        if useNumpy:
+            ret.rowNumbers = _importNumpy().array(sheet._columns[0], dtype='int64')
+        else:
+            ret.rowNumbers = array.array('q', sheet._columns[0])
+        for name, column in cls._getColumns():
+            setattr(ret, name, column.convert(sheet, column.title or name, useNumpy))
+        return ret
+
+    def __len__(self):
+        return len(self.rowNumbers)
+
+
+def _getText(node):
+    """
+    获得文本，可能由内部节点提供（比如<Data><B><Font>xxx</Font></B><I>yyy</I></Data> -> xxxyyy）
+    节点有文本时直接取其文本，否则按先序拼接子节点的文本（非递归，最后一次join）
+    """
+    text = node.text
+    if text:  # 注意：<Data></Data>为None，但空白<Data>   </Data>不为None
+        return text.strip()
+    if not len(node):
+        return ''
+
+    parts = []
+    stack = list(reversed(node))
+    while stack:
+        child = stack.pop()
+        text = child.text
+        if text:
+            parts.append(text.strip())
+        else:
+            stack.extend(reversed(child))
+    return ''.join(parts)
+
+
+def _iterCells(rowNode, profile=None):
+    """返回行节点中每个单元格的(Index属性, 文本)"""
+    if profile is None:
+        for cellNode in rowNode.iterfind(_TAG_CELL):
+            dataNode = cellNode.find(_TAG_DATA)
+            yield cellNode.attrib.get(_ATTR_INDEX), ('' if dataNode is None else _getText(dataNode))
+        return
+
+    perfCounter = time.perf_counter
+    for cellNode in rowNode.iterfind(_TAG_CELL):
+        dataNode = cellNode.find(_TAG_DATA)
+        begin = perfCounter()
+        dataText = '' if dataNode is None else _getText(dataNode)
+        profile.textExtraction += perfCounter() - begin
+        yield cellNode.attrib.get(_ATTR_INDEX), dataText
+
+
+class SheetProfile:
+    """
+    解析一张表时各阶段的耗时（秒），通过enableProfile()开启，结果保存在Sheet.profile中
+    rowScan: 逐行扫描（XML解析、定位行节点）
+    cellScan: 单元格扫描与行列校验（不含textExtraction）
+    textExtraction: 单元格文本提取
+    postPadding: 行的后处理（补齐空列、标题行、下架检测）
+    """
+    __slots__ = ('rowScan', 'cellScan', 'textExtraction', 'postPadding')
+
+    def __init__(self):
+        self.rowScan = 0.0
+        self.cellScan = 0.0
+        self.textExtraction = 0.0
+        self.postPadding = 0.0
+
+    def __str__(self):
+        return 'rowScan=%.3fs cellScan=%.3fs textExtraction=%.3fs postPadding=%.3fs' % (
+            self.rowScan, self.cellScan, self.textExtraction, self.postPadding)
+
+
+_profileEnabled = False
+
+
+def enableProfile(enable=True):
+    """开启后，之后解析的每张表都会记录各阶段耗时（Sheet.profile），会带来少量额外开销"""
+    global _profileEnabled
+    _profileEnabled = enable
+
+
+class _SheetBuilder:
+    """
+    逐行接收表格数据并做校验（行列索引、空行、标题行规则），生成Sheet的标题和行
+    """
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.titleRow = None
+        self.disableCellIndex = None
+        self.lastRowIndex = 0
+        self.rowIndex = 0
+        self.lastFullBlankRowNumber = -1
+        self.profile = SheetProfile() if _profileEnabled else None
+        sheet.profile = self.profile
+        self._lastRowEnd = time.perf_counter()
+
+    def addRow(self, rowIndex, cells):
+        """
+        rowIndex: 行的Index属性（字符串），None表示紧接上一行
+        cells: (cellIndex, text)序列，cellIndex为列的Index属性（字符串），None表示紧接上一列
+        :return 有效的数据行（补齐到标题行长度的列表）；标题行、空行、下架的行返回None
+        """
+        profile = self.profile
+        if profile is None:
+            row, isFullBlankRow = self._scanRow(rowIndex, cells)
+            return self._postRow(row, isFullBlankRow)
+
+        perfCounter = time.perf_counter
+        begin = perfCounter()
+        profile.rowScan += begin - self._lastRowEnd
+        textExtraction = profile.textExtraction
+
+        row, isFullBlankRow = self._scanRow(rowIndex, cells)
+
+        cellEnd = perfCounter()
+        profile.cellScan += cellEnd - begin - (profile.textExtraction - textExtraction)
+
+        row = self._postRow(row, isFullBlankRow)
+
+        self._lastRowEnd = perfCounter()
+        profile.postPadding += self._lastRowEnd - cellEnd
+        return row
+
+    def _scanRow(self, rowIndex, cells):
+        lastRowIndex = self.lastRowIndex
+        if rowIndex is None:
+            rowIndex = self.rowIndex + 1
+        else:
+            try:
+                rowIndex = int(rowIndex)
+            except:
+                raise Workbook_Error('XML包含无效数据：Row包含无效Index(%s), LastRow(%d)' % (rowIndex, lastRowIndex))
+        self.rowIndex = rowIndex
+
+        if rowIndex < lastRowIndex + 1:
+            raise Workbook_Error('XML包含无效数据：RowIndex(%s) < LastRow(%d)+1' % (rowIndex, lastRowIndex))
+
+        if rowIndex > lastRowIndex + 1:
+            self.lastFullBlankRowNumber = rowIndex - 1
+
+        # 产生新行数据
+        row = []
+
+        # 第0列存储行号
+        if rowIndex == TITLE_ROW_INDEX:
+            row.append(ROW_NUMBER_SIGN)
+        else:
+            row.append(rowIndex)
+
+        lastCellIndex = 0
+        cellIndex = 0
+
+        isFullBlankRow = True  # 当前行是否为完全空行（可能只包括Style信息或空白）
+        for cellIndexAttr, dataText in cells:
+            if cellIndexAttr is None:
+                cellIndex += 1
+            else:
+                try:
+                    cellIndex = int(cellIndexAttr)
+                except:
+                    raise Workbook_Error('XML包含无效数据：Cell包含无效Index(%s), LastRow(%d), LastCell(%d)' % (cellIndexAttr, lastRowIndex, lastCellIndex))
+
+            if cellIndex < lastCellIndex + 1:
+                raise Workbook_Error('第 %d 行 第 %d 列，XML包含无效数据：无效的列索引' % (rowIndex, cellIndex))
+
+            # 缺失的列自动填充为空
+            for index in range(lastCellIndex+1, cellIndex):
+                if rowIndex == TITLE_ROW_INDEX:
+                    raise Workbook_Error('第 %d 行 第 %d 列，标题行不能包含空列' % (rowIndex, index))
+                else:
+                    row.append('')
+            lastCellIndex = cellIndex
+
+            if dataText:
+                isFullBlankRow = False
+
+            row.append(dataText)
+
+        self.lastRowIndex = rowIndex
+        return row, isFullBlankRow
+
+    def _postRow(self, row, isFullBlankRow):
+        rowIndex = self.rowIndex
+        if self.lastFullBlankRowNumber > 0:
+            if not isFullBlankRow:
+                raise Workbook_Error('第 %d 行不能为空行' % self.lastFullBlankRowNumber)
+            return None
+
+        if isFullBlankRow:
+            self.lastFullBlankRowNumber = rowIndex  # 允许最后的几行为空行（这些行会被丢弃）
+            return None
+
+        if self.titleRow is None:
+            self._setTitleRow(row)
+            return None
+
+        # 缺失的列自动填充为空，使行长度等于标题行长度
+        titleCount = len(self.titleRow)
+        if len(row) < titleCount:
+            row.extend([''] * (titleCount - len(row)))
+
+        if self.disableCellIndex is not None and row[self.disableCellIndex] == ROW_DISABLE_TAG:
+            return None
+        return row
+
+    def _setTitleRow(self, titleRow):
+        self.titleRow = titleRow
+        self.sheet._setTitles(titleRow[1:])
+        self.disableCellIndex = self.sheet._titleToCellIndexMap.get(ROW_DISABLE_TAG)
+
+    def finish(self):
+        if self.titleRow is None:
+            raise Workbook_Error('标题行(第 %d 行)必须存在' % TITLE_ROW_INDEX)
+        self.sheet._compact()
+
+
 class Sheet:
     def __init__(self):
         self._name = ''
         self._titles = []  # 标题列表
-        self._rows = [] # 行对象列表(不含标题行）
+        self._columns = []  # 按列存储的数据(不含标题行），第0列为行号(array)，其余为_Column
+        self._rowCount = 0
         self._titleToCellIndexMap = {}  # 标题对应列索引（包含系统产生的标题 ROW_NUMBER_SIGN)
+        self._indexes = {}  # 标题 -> {值: 行位置列表}
+        self.profile = None  # 开启enableProfile()时为SheetProfile
 
     def __iter__(self):
-        return iter(self._rows)
+        for index in range(self._rowCount):
+            yield Row(self, index)
+
+    def __len__(self):
+        return self._rowCount
+
+    def __getitem__(self, index):
+        """第index个数据行（从0开始，不含标题行）"""
+        if index < 0:
+            index += self._rowCount
+        if not 0 <= index < self._rowCount:
+            raise IndexError('row index out of range')
+        return Row(self, index)
 
     @property
     def name(self):
@@ -75,8 +557,43 @@ class Sheet:
     def titles(self):
         return self._titles
 
+    def _setTitles(self, titles):
+        self._titles = titles
+        self._titleToCellIndexMap = {ROW_NUMBER_SIGN: 0}
+        for index, title in enumerate(titles):
+            self._titleToCellIndexMap[title] = index + 1
+        self._columns = [array.array('q')] + [_Column() for _ in titles]
+        self._rowCount = 0
+        self._indexes = {}
+
+    def _appendRow(self, row):
+        """row: 补齐到标题行长度的列表（第0列为行号）"""
+        for column, value in zip(self._columns, row):
+            column.append(value)
+        self._rowCount += 1
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_indexes'] = {}  # 索引不需要序列化
+        return state
+
+    def _compact(self):
+        for column in self._columns[1:]:
+            column.compact()
+
+    def column(self, title):
+        """返回title列所有行的值（列表），不产生行对象"""
+        try:
+            cellIndex = self._titleToCellIndexMap[title]
+        except KeyError:
+            raise Workbook_InvalidColumnError(self, title)
+        column = self._columns[cellIndex]
+        if cellIndex == 0:
+            return column.tolist()
+        return column.toList()
+
     def parseFromXMLNode(self, node):
-        tableNode = node.find('{urn:schemas-microsoft-com:office:spreadsheet}Table')
+        tableNode = node.find(_TAG_TABLE)
         if tableNode is None:
             raise Workbook_Error('解析 Table 节点失败')
 
@@ -85,163 +602,498 @@ class Sheet:
         1 内容1 内容2
         2 内容3 内容4
         """
-        rows = []
+        builder = _SheetBuilder(self)
+        for rowNode in tableNode.iterfind(_TAG_ROW):
+            row = builder.addRow(rowNode.attrib.get(_ATTR_INDEX), _iterCells(rowNode, builder.profile))
+            if row is not None:
+                self._appendRow(row)
+        builder.finish()
 
-        lastRowIndex = 0
-        rowIndex = 0
-        lastFullBlankRowNumber = -1
-        for rowNode in tableNode.iterfind('{urn:schemas-microsoft-com:office:spreadsheet}Row'):
+    def createIndex(self, title, unique=False):
+        """
+        为title列建立（并缓存）值到行位置列表的索引，find/findAll/uniqueCheck会自动使用
+        unique: 是否要求该列的值唯一，否则抛出Workbook_UniqueCheckError
+        通过Row.set修改值或调用invalidateIndexes后索引会重建
+        """
+        index = self._indexes.get(title)
+        if index is None:
             try:
-                rowIndex = rowNode.attrib['{urn:schemas-microsoft-com:office:spreadsheet}Index']
+                cellIndex = self._titleToCellIndexMap[title]
             except KeyError:
-                rowIndex += 1
-
-            if isinstance(rowIndex, str):
-                try:
-                    rowIndex = int(rowIndex)
-                except:
-                    raise Workbook_Error('XML包含无效数据：Row包含无效Index(%s), LastRow(%d)' % (rowIndex, lastRowIndex))
+                raise Workbook_InvalidColumnError(self, title)
 
-            if rowIndex < lastRowIndex + 1:
-                raise Workbook_Error('XML包含无效数据：RowIndex(%s) < LastRow(%d)+1' % (rowIndex, lastRowIndex))
-
-            if rowIndex > lastRowIndex + 1:
-                lastFullBlankRowNumber = rowIndex - 1
-
-            # 产生新行数据
-            row = []
-
-            # 第0列存储行号
-            if rowIndex == TITLE_ROW_INDEX:
-                row.append(ROW_NUMBER_SIGN)
+            column = self._columns[cellIndex]
+            if cellIndex == 0:
+                index = {value: [position] for position, value in enumerate(column)}
             else:
-                row.append(rowIndex)
-
-            lastCellIndex = 0
-            cellIndex = 0
+                # 按编号分组，再映射回值
+                groups = [[] for _ in column.values]
+                for position, code in enumerate(column.codes):
+                    groups[code].append(position)
+                index = {value: positions for value, positions in zip(column.values, groups) if positions}
+            self._indexes[title] = index
 
-            isFullBlankRow = True  # 当前行是否为完全空行（可能只包括Style信息或空白）
-            for cellNode in rowNode.iterfind('{urn:schemas-microsoft-com:office:spreadsheet}Cell'):
-                try:
-                    cellIndex = cellNode.attrib['{urn:schemas-microsoft-com:office:spreadsheet}Index']
-                except KeyError:
-                    cellIndex += 1
+        if unique:
+            self._checkIndexUnique(title, index)
+        return index
 
-                if isinstance(cellIndex, str):
-                    try:
-                        cellIndex = int(cellIndex)
-                    except:
-                        raise Workbook_Error('XML包含无效数据：Cell包含无效Index(%s), LastRow(%d), LastCell(%d)' % (cellIndex, lastRowIndex, lastCellIndex))
-
-                if cellIndex < lastCellIndex + 1:
-                    raise Workbook_Error('第 %d 行 第 %d 列，XML包含无效数据：无效的列索引' % (rowIndex, cellIndex))
-
-                # 缺失的列自动填充为空
-                for index in range(lastCellIndex+1, cellIndex):
-                    if rowIndex == TITLE_ROW_INDEX:
-                        raise Workbook_Error('第 %d 行 第 %d 列，标题行不能包含空列' % (rowIndex, index))
-                    else:
-                        row.append('')
-                lastCellIndex = cellIndex
-
-                dataText = ''
-                dataNode = cellNode.find('{urn:schemas-microsoft-com:office:spreadsheet}Data')                
-                if dataNode is not None:
-                    
-                    def _getText(node):  # 获得文本，可能由内部节点提供（比如<Data><B><Font>xxx</Font></B><I>yyy</I></Data> -> xxxyyy）
-                        if node.text:  # 注意：<Data></Data>为None，但空白<Data>   </Data>不为None
-                            return node.text.strip()
-                        
-                        s = ''
-                        for nod in node:  # 所有子节点拼接
-                            s += _getText(nod)
-                        return s
-                    
-                    dataText = _getText(dataNode)                    
-
-                if dataText:
-                    isFullBlankRow = False
-
-                row.append(dataText)
-
-            if lastFullBlankRowNumber > 0:
-                if not isFullBlankRow:
-                    raise Workbook_Error('第 %d 行不能为空行' % lastFullBlankRowNumber)
-            else:
-                if isFullBlankRow:
-                    lastFullBlankRowNumber = row[0]  # 允许最后的几行为空行（这些行会被丢弃）
-                else:
-                    rows.append(row)
+    def invalidateIndexes(self, title=None):
+        """使title列（None表示所有列）的索引失效"""
+        if title is None:
+            self._indexes = {}
+        else:
+            self._indexes.pop(title, None)
 
-            lastRowIndex = rowIndex
-            
-        if len(rows) == 0:
-            raise Workbook_Error('标题行(第 %d 行)必须存在' % TITLE_ROW_INDEX)
-        titleRow = rows[0]
-        self._titles = titleRow[1:]
-
-        for index, title in enumerate(titleRow):
-            self._titleToCellIndexMap[title] = index
-
-        # 缺失的列自动填充为空，使行长度等于标题行长度
-        for rowIndex in range(1, len(rows)):
-            row = rows[rowIndex]
-            for _ in range(len(row), len(titleRow)):
-                row.append('')
-
-        # generate Row objects
-        self._rows = []
-        for rowIndex in range(1, len(rows)):
-            row = Row(self, rows[rowIndex])
-            if row.enabled:
-                self._rows.append(row)
+    def _checkIndexUnique(self, title, index, skipValue=None):
+        # 与逐行检测的结果一致：报告最早出现重复的那一行
+        firstDuplicate = None
+        for value, positions in index.items():
+            if len(positions) < 2:
+                continue
+            if skipValue is not None and value == skipValue:
+                continue
+            if firstDuplicate is None or positions[1] < firstDuplicate[1]:
+                firstDuplicate = positions
+        if firstDuplicate is not None:
+            raise Workbook_UniqueCheckError(self, title, Row(self, firstDuplicate[0]), Row(self, firstDuplicate[1]))
 
     def find(self, title, value):
         """
         找到title列值为value所在的行
         """
-        for row in self._rows:
-            if row[title] == value:
-                return row
-        return None
+        positions = self.createIndex(title).get(value)
+        return Row(self, positions[0]) if positions else None
+
+    def findAll(self, title, value):
+        """
+        找到title列值为value所在的所有行
+        """
+        return [Row(self, position) for position in self.createIndex(title).get(value, ())]
 
     def uniqueCheck(self, title, skipValue=None):
         """
         检测某列是否包含重复值，若值为skipValue则跳过检测
         """
-        values = {}
-        for row in self._rows:
-            curValue = row[title]
-            if skipValue is not None and curValue == skipValue:
-                continue
-            if curValue in values:
-                raise Workbook_UniqueCheckError(self, title, values[curValue], row)
-            else:
-                values[curValue] = row
+        self._checkIndexUnique(title, self.createIndex(title), skipValue)
 
 
-def readXML(xmlPath):
-    book = {}
+def _iterXML(source, xmlPath, sheetCount=0):
+    """
+    基于iterparse流式解析，依次返回(sheet, row)（row为数据列表），每张表解析完成（并通过校验）后返回(sheet, None)
+    已处理的Row节点会被立即清除，因此内存占用与文件大小无关
+    source: 文件路径或文件对象；xmlPath用于错误提示
+    sheetCount: source中第一张表之前已有的表数量（用于错误提示）
+    """
+    root = None
+    sheet = None
+    builder = None
+    tableNode = None
+    tableFound = False
+
+    def wrapSheetError(e):
+        return Workbook_Error("解析 '%s' 表失败：%s" % (sheet.name, e))
 
     try:
-        tree = ET.ElementTree(file=xmlPath)
+        for event, node in ET.iterparse(source, events=('start', 'end')):
+            tag = node.tag
+            if event == 'start':
+                if root is None:
+                    root = node
+                elif tag == _TAG_WORKSHEET:
+                    sheetCount += 1
+                    try:
+                        sheetName = node.attrib[_ATTR_NAME]
+                    except Exception as e:
+                        raise Workbook_Error("第 %d 张表，解析名称失败：%s" % (sheetCount, e))
+                    sheet = Sheet()
+                    sheet._name = sheetName
+                    builder = _SheetBuilder(sheet)
+                    tableFound = False
+                elif tag == _TAG_TABLE and builder is not None and not tableFound:
+                    tableNode = node
+                    tableFound = True
+                continue
+
+            if tag == _TAG_ROW and tableNode is not None:
+                try:
+                    row = builder.addRow(node.attrib.get(_ATTR_INDEX), _iterCells(node, builder.profile))
+                except Exception as e:
+                    raise wrapSheetError(e)
+                node.clear()
+                tableNode.remove(node)
+                if row is not None:
+                    yield sheet, row
+            elif node is tableNode:
+                tableNode = None
+            elif tag == _TAG_WORKSHEET and builder is not None:
+                try:
+                    if not tableFound:
+                        raise Workbook_Error('解析 Table 节点失败')
+                    builder.finish()
+                except Exception as e:
+                    raise wrapSheetError(e)
+                node.clear()
+                if node in root:
+                    root.remove(node)
+                yield sheet, None
+                sheet = None
+                builder = None
     except ET.ParseError as e:
         raise Workbook_Error("解析XML文件 '%s' 失败: %s" % (xmlPath, e))
 
-    sheetCount = 0
-    for sheetNode in tree.iterfind('{urn:schemas-microsoft-com:office:spreadsheet}Worksheet'):
-        sheetCount += 1
-        sheet = Sheet()
-        try:
-            sheetName = sheetNode.attrib['{urn:schemas-microsoft-com:office:spreadsheet}Name']
-        except Exception as e:
-            raise Workbook_Error("第 %d 张表，解析名称失败：%s" % (sheetCount, e))
-        sheet._name = sheetName
-        book[sheetName] = sheet
 
+def iterXMLRows(xmlPath):
+    """
+    流式读取xml，逐行返回有效的数据行（Row对象，通过row.sheet获得所属表的名称和标题）
+    适用于无需随机访问的大文件：与readXML的校验规则相同，但不保存任何已返回的行
+    example:
+        for row in AWorkbook.iterXMLRows(xmlPath):
+            print(row.sheet.name, row['ID'])
+    """
+    for sheet, row in _iterXML(xmlPath, xmlPath):
+        if row is not None:
+            yield _DetachedRow(sheet, row)
+
+
+def _readSheets(source, xmlPath, sheetCount=0):
+    sheets = []
+    for sheet, row in _iterXML(source, xmlPath, sheetCount):
+        if row is not None:
+            sheet._appendRow(row)
+        else:
+            sheets.append(sheet)
+    return sheets
+
+
+_WORKBOOK_BEGIN_PATTERN = re.compile(rb'<((?:[\w.-]+:)?Workbook)\b[^>]*>')
+_WORKSHEET_BEGIN_PATTERN = re.compile(rb'<(?:[\w.-]+:)?Worksheet[\s/>]')
+_WORKSHEET_END_PATTERN = re.compile(rb'</(?:[\w.-]+:)?Worksheet\s*>')
+
+
+def _findWorksheetRanges(xmlPath):
+    """
+    找到每个Worksheet节点在文件中的字节范围
+    :return (prolog, rootEnd, ranges)：prolog为根节点（含命名空间声明）之前的全部内容，rootEnd为根节点的结束标签；
+        无法定位时返回None
+    """
+    with open(xmlPath, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            m = _WORKBOOK_BEGIN_PATTERN.search(mm)
+            if m is None:
+                return None
+            prolog = mm[:m.end()]
+            rootEnd = b'</' + m.group(1) + b'>'
+
+            ranges = []
+            pos = m.end()
+            while True:
+                begin = _WORKSHEET_BEGIN_PATTERN.search(mm, pos)
+                if begin is None:
+                    break
+                end = _WORKSHEET_END_PATTERN.search(mm, begin.end())
+                if end is None:
+                    return None
+                ranges.append((begin.start(), end.end()))
+                pos = end.end()
+    return prolog, rootEnd, ranges
+
+
+def _parseWorksheetRange(xmlPath, prolog, rootEnd, begin, end, sheetCount):
+    """在子进程中解析[begin, end)范围内的一张表"""
+    with open(xmlPath, 'rb') as fp:
+        fp.seek(begin)
+        data = fp.read(end - begin)
+    return _readSheets(io.BytesIO(prolog + data + rootEnd), xmlPath, sheetCount)
+
+
+def _readXMLParallel(xmlPath, jobs):
+    found = _findWorksheetRanges(xmlPath)
+    if found is None or len(found[2]) < 2:
+        return _readSheets(xmlPath, xmlPath)
+
+    prolog, rootEnd, ranges = found
+    with ProcessPoolExecutor(max_workers=min(jobs, len(ranges))) as executor:
+        futures = [executor.submit(_parseWorksheetRange, xmlPath, prolog, rootEnd, begin, end, sheetCount)
+                   for sheetCount, (begin, end) in enumerate(ranges)]
+        sheets = []
+        for future in futures:
+            sheets.extend(future.result())
+    return sheets
+
+
+_CACHE_VERSION = 1
+
+
+def _getCacheKey(xmlPath, cacheKey):
+    if cacheKey == 'mtime':
+        stat = os.stat(xmlPath)
+        return (stat.st_mtime_ns, stat.st_size)
+    elif cacheKey == 'md5':
+        return AHash.getMD5OfFile(xmlPath)
+    raise Workbook_Error('未知的cacheKey: %s' % cacheKey)
+
+
+def _getCachePath(xmlPath, cacheDir):
+    if cacheDir is None:
+        return xmlPath + '.cache'
+    return os.path.join(cacheDir, AHash.getMD5OfStr(os.path.abspath(xmlPath)) + '.cache')
+
+
+def _loadCache(cachePath, key):
+    try:
+        with open(cachePath, 'rb') as fp:
+            version, cachedKey, book = pickle.load(fp)
+    except Exception:
+        return None
+    if version != _CACHE_VERSION or cachedKey != key:
+        return None
+    return book
+
+
+def _saveCache(cachePath, key, book):
+    try:
+        AFile.atomicWrite(cachePath, pickle.dumps((_CACHE_VERSION, key, book), pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass  # 缓存只是加速手段，不可写时忽略
+
+
+def readXML(xmlPath, jobs=1, useCache=False, cacheDir=None, cacheKey='mtime'):
+    """
+    读取xml，返回{表名: Sheet}
+    jobs: 大于1时用多进程并行解析各张表（表较多且较大时才有收益）
+    useCache: 是否使用解析结果缓存（pickle），文件未变化时直接加载
+    cacheDir: 缓存目录，None表示缓存在xml旁边(xmlPath + '.cache')
+    cacheKey: 判断文件是否变化的方式，'mtime'（修改时间和大小）或'md5'（文件摘要）
+    """
+    if useCache:
+        key = _getCacheKey(xmlPath, cacheKey)
+        cachePath = _getCachePath(xmlPath, cacheDir)
+        book = _loadCache(cachePath, key)
+        if book is not None:
+            return book
+
+    if jobs > 1:
+        sheets = _readXMLParallel(xmlPath, jobs)
+    else:
+        sheets = _readSheets(xmlPath, xmlPath)
+
+    book = {}
+    for sheet in sheets:
+        book[sheet.name] = sheet
+
+    if useCache:
+        if cacheDir is not None:
+            AOS.makeDir(cacheDir)
+        _saveCache(cachePath, key, book)
+    return book
+
+
+def _iterCSVCells(record):
+    # 与XML一致：文本去除首尾空白，空单元格视为缺失（标题行中间缺失的列会报错，末尾的则忽略）
+    for index, text in enumerate(record):
+        text = text.strip()
+        if text:
+            yield index + 1, text
+
+
+def readCSV(csvPath, sheetName=None, delimiter=',', encoding='utf-8-sig'):
+    """
+    读取CSV（使用C实现的csv模块），返回Sheet，第一行为标题行，校验规则与readXML相同
+    sheetName: 表名，None表示使用文件名（不含扩展名）
+    """
+    if sheetName is None:
+        sheetName = os.path.splitext(os.path.basename(csvPath))[0]
+
+    sheet = Sheet()
+    sheet._name = sheetName
+    builder = _SheetBuilder(sheet)
+    try:
+        with open(csvPath, encoding=encoding, newline='') as fp:
+            for record in csv.reader(fp, delimiter=delimiter):
+                row = builder.addRow(None, _iterCSVCells(record))
+                if row is not None:
+                    sheet._appendRow(row)
+        builder.finish()
+    except Exception as e:
+        raise Workbook_Error("解析 '%s' 表失败：%s" % (sheetName, e))
+    return sheet
+
+
+def readTSV(tsvPath, sheetName=None, encoding='utf-8-sig'):
+    """读取TSV（制表符分隔），参考readCSV"""
+    return readCSV(tsvPath, sheetName, '\t', encoding)
+
+
+_XLSX_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_XLSX_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_XLSX_PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_XLSX_CELL_REF_PATTERN = re.compile(r'([A-Z]+)')
+
+
+def _xlsxColumnIndex(cellRef):
+    """'A1' -> 1, 'AB12' -> 28"""
+    m = _XLSX_CELL_REF_PATTERN.match(cellRef)
+    if m is None:
+        raise Workbook_Error('无效的单元格引用(%s)' % cellRef)
+    index = 0
+    for c in m.group(1):
+        index = index * 26 + ord(c) - ord('A') + 1
+    return index
+
+
+def _xlsxText(node):
+    """拼接节点下所有<t>的文本（忽略拼音注音<rPh>）"""
+    if node is None:
+        return ''
+    t = node.find(_XLSX_MAIN_NS + 't')
+    if t is not None:
+        return t.text or ''
+    return ''.join(r.findtext(_XLSX_MAIN_NS + 't', '') for r in node.iterfind(_XLSX_MAIN_NS + 'r'))
+
+
+def _readXLSXSharedStrings(zf):
+    try:
+        fp = zf.open('xl/sharedStrings.xml')
+    except KeyError:
+        return []
+    strings = []
+    with fp:
+        for _, node in ET.iterparse(fp):
+            if node.tag == _XLSX_MAIN_NS + 'si':
+                strings.append(_xlsxText(node))
+                node.clear()
+    return strings
+
+
+def _iterXLSXCells(rowNode, sharedStrings):
+    for cellNode in rowNode.iterfind(_XLSX_MAIN_NS + 'c'):
+        cellRef = cellNode.get('r')
+        cellType = cellNode.get('t')
+        if cellType == 'inlineStr':
+            text = _xlsxText(cellNode.find(_XLSX_MAIN_NS + 'is'))
+        else:
+            text = cellNode.findtext(_XLSX_MAIN_NS + 'v', '')
+            if cellType == 's' and text:
+                text = sharedStrings[int(text)]
+        yield (_xlsxColumnIndex(cellRef) if cellRef else None), text.strip()
+
+
+def _readXLSXSheet(zf, sheetName, sheetPath, sharedStrings):
+    sheet = Sheet()
+    sheet._name = sheetName
+    builder = _SheetBuilder(sheet)
+    sheetDataNode = None
+    with zf.open(sheetPath) as fp:
+        for event, node in ET.iterparse(fp, events=('start', 'end')):
+            if event == 'start':
+                if node.tag == _XLSX_MAIN_NS + 'sheetData':
+                    sheetDataNode = node
+                continue
+            if node.tag == _XLSX_MAIN_NS + 'row' and sheetDataNode is not None:
+                row = builder.addRow(node.get('r'), _iterXLSXCells(node, sharedStrings))
+                node.clear()
+                sheetDataNode.remove(node)
+                if row is not None:
+                    sheet._appendRow(row)
+    builder.finish()
+    return sheet
+
+
+def readXLSX(xlsxPath):
+    """
+    读取xlsx（不依赖第三方库，流式解析zip中的表格xml），返回{表名: Sheet}，校验规则与readXML相同
+    注意：单元格取其存储的原始值（数字、日期为数值文本，公式取缓存的计算结果）
+    """
+    try:
+        zf = zipfile.ZipFile(xlsxPath)
+    except (OSError, zipfile.BadZipFile) as e:
+        raise Workbook_Error("打开xlsx文件 '%s' 失败: %s" % (xlsxPath, e))
+
+    book = {}
+    with zf:
         try:
-            sheet.parseFromXMLNode(sheetNode)
-        except Exception as e:
-            raise Workbook_Error("解析 '%s' 表失败：%s" % (sheetName, e))
+            relsRoot = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+            workbookRoot = ET.fromstring(zf.read('xl/workbook.xml'))
+            sharedStrings = _readXLSXSharedStrings(zf)
+        except (KeyError, ET.ParseError) as e:
+            raise Workbook_Error("解析xlsx文件 '%s' 失败: %s" % (xlsxPath, e))
+
+        targets = {}
+        for rel in relsRoot.iterfind(_XLSX_PACKAGE_REL_NS + 'Relationship'):
+            target = rel.get('Target')
+            targets[rel.get('Id')] = target[1:] if target.startswith('/') else 'xl/' + target
 
+        for sheetCount, sheetNode in enumerate(workbookRoot.iter(_XLSX_MAIN_NS + 'sheet'), 1):
+            sheetName = sheetNode.get('name')
+            sheetPath = targets.get(sheetNode.get(_XLSX_REL_NS + 'id'))
+            if sheetName is None or sheetPath is None:
+                raise Workbook_Error("第 %d 张表，解析名称失败" % sheetCount)
+            try:
+                book[sheetName] = _readXLSXSheet(zf, sheetName, sheetPath, sharedStrings)
+            except Exception as e:
+                raise Workbook_Error("解析 '%s' 表失败：%s" % (sheetName, e))
     return book
+
+
+def _writeBenchmarkFiles(dir, rowCount, columnCount):
+    titles = ['T%d' % i for i in range(columnCount)]
+    rows = [[str(r * columnCount + c) if c % 2 else 'v%d' % ((r + c) % 100) for c in range(columnCount)] for r in range(rowCount)]
+
+    xmlPath = os.path.join(dir, 'bench.xml')
+    with open(xmlPath, 'w', encoding='utf-8') as fp:
+        fp.write('<?xml version="1.0"?>\n<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet" '
+                 'xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">\n<Worksheet ss:Name="bench"><Table>\n')
+        for row in [titles] + rows:
+            fp.write('<Row>')
+            for text in row:
+                fp.write('<Cell><Data ss:Type="String">%s</Data></Cell>' % text)
+            fp.write('</Row>\n')
+        fp.write('</Table></Worksheet></Workbook>\n')
+
+    csvPath = os.path.join(dir, 'bench.csv')
+    with open(csvPath, 'w', encoding='utf-8', newline='') as fp:
+        csv.writer(fp).writerows([titles] + rows)
+
+    xlsxPath = os.path.join(dir, 'bench.xlsx')
+    sharedStrings = {}
+    sheetXML = io.StringIO()
+    for r, row in enumerate([titles] + rows, 1):
+        sheetXML.write('<row r="%d">' % r)
+        for text in row:
+            sheetXML.write('<c t="s"><v>%d</v></c>' % sharedStrings.setdefault(text, len(sharedStrings)))
+        sheetXML.write('</row>')
+    main = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    with zipfile.ZipFile(xlsxPath, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('xl/workbook.xml', '<workbook %s xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                    '<sheets><sheet name="bench" sheetId="1" r:id="rId1"/></sheets></workbook>' % main)
+        zf.writestr('xl/_rels/workbook.xml.rels', '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+                    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/></Relationships>')
+        zf.writestr('xl/sharedStrings.xml', '<sst %s>%s</sst>' % (main, ''.join('<si><t>%s</t></si>' % s for s in sharedStrings)))
+        zf.writestr('xl/worksheets/sheet1.xml', '<worksheet %s><sheetData>%s</sheetData></worksheet>' % (main, sheetXML.getvalue()))
+
+    return xmlPath, csvPath, xlsxPath
+
+
+def benchmark(rowCount=100000, columnCount=10):
+    """比较同一份数据在各格式下的加载时间"""
+    with tempfile.TemporaryDirectory() as dir:
+        xmlPath, csvPath, xlsxPath = _writeBenchmarkFiles(dir, rowCount, columnCount)
+        cases = [
+            ('xml', xmlPath, lambda: readXML(xmlPath)),
+            ('xml(cache)', xmlPath, lambda: readXML(xmlPath, useCache=True, cacheDir=dir)),
+            ('csv', csvPath, lambda: readCSV(csvPath)),
+            ('xlsx', xlsxPath, lambda: readXLSX(xlsxPath)),
+        ]
+        readXML(xmlPath, useCache=True, cacheDir=dir)  # 生成缓存
+        print('%d rows x %d columns' % (rowCount, columnCount))
+        for name, path, load in cases:
+            begin = time.perf_counter()
+            load()
+            print('%-12s %10d bytes %8.3f s' % (name, os.path.getsize(path), time.perf_counter() - begin))
+
+
+if __name__ == '__main__':
+    benchmark(*[int(arg) for arg in sys.argv[1:]])